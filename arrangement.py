@@ -0,0 +1,178 @@
+from __future__ import annotations  # so that methods can return Arrangements
+from dataclasses import dataclass
+from decimal import Decimal
+from fractions import Fraction
+from typing import Any, Iterator, Optional
+
+from mido import MidiFile  # type: ignore
+
+from cyclemidi import (
+    Cycles,
+    Note,
+    Voice,
+    calc_desired_voice_length,
+    generate_midi,
+    parse_cycle_lists,
+    place_notes,
+)
+from midi import Config, play_midi
+
+###
+# Verse/chorus/bridge style pieces: each section is a Cycles that's compiled once, the
+# arrangement is just a list of references to sections and the cycle each one starts
+# at.  The notes of a section are never copied per placement, they're moved into place
+# one at a time as the MIDI file is written.
+#
+# A section sounds the way it does on its own: it's compiled (and checked against the
+# cost limits) with its own config and keeps its own note_width.  The arrangement's
+# config is the MIDI file's, so every section's tempo and meter must match it.
+###
+
+
+@dataclass
+class CompiledSection:
+    voices: list[Voice]
+    # how long the section's voices are, i.e. how far apart back to back placements are
+    cycle_count: int
+
+
+@dataclass
+class Placement:
+    section: str
+    # the cycle the section starts at
+    start: int
+
+
+class Arrangement:
+    def __init__(self) -> None:
+        self.sections: dict[str, Cycles] = {}
+        self.placements: list[Placement] = []
+        self.compiled: dict[str, CompiledSection] = {}
+        self.midi_file: Optional[MidiFile] = None
+        self.total_secs: int = 0
+        self.config: Config = Config()
+
+    # "public" methods
+    def section(self, name: str, cycles: Cycles) -> Arrangement:
+        """
+        Defines (or redefines) a section, nothing is compiled until it's used.
+        """
+        self.sections[name] = cycles
+        self.compiled.pop(name, None)
+        return self
+
+    def then(self, *names: str) -> Arrangement:
+        """
+        Places the sections one after the other, starting at the end of the arrangement
+        so far.
+        """
+        for name in names:
+            self.place(name, self.cycle_count())
+        return self
+
+    def place(self, name: str, at: int) -> Arrangement:
+        """
+        Places a section starting at cycle at.  A section can't overlap another one.
+        """
+        end = at + self.compile_section(name).cycle_count
+        for placement in self.placements:
+            assert end <= placement.start or at >= self.placement_end(placement), (
+                f"{name} at cycle {at} overlaps {placement.section} at cycle"
+                f" {placement.start}"
+            )
+        self.placements.append(Placement(name, at))
+        self.placements.sort(key=lambda placement: placement.start)
+        return self
+
+    def set_config(self, param: str, val: Any) -> Arrangement:
+        setattr(self.config, param, val)
+        return self
+
+    def midi(self) -> Arrangement:
+        for name in sorted({placement.section for placement in self.placements}):
+            config = self.sections[name].config
+            if (config.beats_per_minute, config.beats_per_measure) != (
+                self.config.beats_per_minute,
+                self.config.beats_per_measure,
+            ):
+                raise Exception(
+                    f"Section {name} is at {config.beats_per_minute} bpm with"
+                    f" {config.beats_per_measure} beats per measure but the arrangement"
+                    f" is at {self.config.beats_per_minute} bpm with"
+                    f" {self.config.beats_per_measure}: a MIDI file has one tempo and"
+                    f" meter"
+                )
+        (self.midi_file, self.total_secs) = generate_midi(
+            [self.voice(i) for i in range(self.voice_count())],
+            self.config,
+            self.cycle_count(),
+        )
+
+        return self
+
+    def play(self) -> Arrangement:
+        play_midi(self.config, self.total_secs)
+
+        return self
+
+    # "private" methods
+    def compile_section(self, name: str) -> CompiledSection:
+        if name not in self.compiled:
+            cycles = self.sections[name]
+            cycles.estimate_cost().check(cycles.config)
+            (voices, _) = parse_cycle_lists(
+                cycles.cycle_lists, cycles.config.compile_workers
+            )
+            self.compiled[name] = CompiledSection(
+                voices, calc_desired_voice_length(voices)
+            )
+        return self.compiled[name]
+
+    def placement_end(self, placement: Placement) -> int:
+        return placement.start + self.compile_section(placement.section).cycle_count
+
+    def cycle_count(self) -> int:
+        return max(map(self.placement_end, self.placements), default=0)
+
+    def voice_count(self) -> int:
+        return max(
+            (
+                len(self.compile_section(placement.section).voices)
+                for placement in self.placements
+            ),
+            default=0,
+        )
+
+    def voice(self, i: int) -> Iterator[Note]:
+        """
+        Lazily walks voice i of every placement in order, moving each section's notes
+        into place as it goes.
+        """
+        for placement in self.placements:
+            voices = self.compile_section(placement.section).voices
+            if i < len(voices):
+                notes = place_notes(voices[i], Fraction(placement.start), Fraction(1))
+                width = self.note_width(placement.section)
+                if width is None:
+                    yield from notes
+                else:
+                    for note in notes:
+                        if note.width is None:
+                            note.width = width
+                        yield note
+
+    def note_width(self, name: str) -> Optional[Decimal]:
+        """
+        The width the notes of a section without their own need to be given so they
+        sound the way they do on their own, None if the arrangement's is the same.
+        """
+        note_width = self.sections[name].config.note_width
+        if note_width == self.config.note_width:
+            return None
+        return Decimal(note_width)
+
+    def voices(self) -> list[Voice]:
+        """
+        Every voice written out in full, e.g. for render.render_voices.
+        """
+        return [list(self.voice(i)) for i in range(self.voice_count())]
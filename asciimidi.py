@@ -1,55 +1,49 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from fractions import Fraction
+import os
 import re
 
-from mido import MidiFile, bpm2tempo, tick2second, MidiTrack, Message, MetaMessage
+from mido import MidiFile, bpm2tempo, tick2second
 
-from midi import get_midi_note_and_velocity, play_midi
+from cyclemidi import Note, append_note, build_midi_file, new_track, ticks_per_cycle
+from midi import play_midi, process_pool
 
 WS_RE = re.compile(' +')
 
-rest_length = 0
-def process_symbol(track, channel, symbol, symbol_start, symbol_end):
-    global rest_length
-    if symbol in ('---', '--'):
-        rest_length += symbol_start + symbol_end
-    else:
-        if symbol in ('===', '=='):
-            track[-1].time += symbol_start + symbol_end
-        else: 
-            midi_note, velocity = get_midi_note_and_velocity(symbol)
-
-            track.append(
-                Message(
-                    'note_on',
-                    channel=channel,
-                    note=midi_note,
-                    velocity=velocity,
-                    # delta from preceding note_off (or start of song)
-                    time=rest_length+symbol_start
-                )
-            )
-            track.append(
-                Message(
-                    'note_off',
-                    channel=channel,
-                    note=midi_note,
-                    velocity=velocity,
-                    # delta from preceding note_on
-                    time=symbol_end
-                )
-            )
-
-        rest_length = 0
+###
+# Note: nothing in here keeps state at the module level so any number of scores (or voices
+# of a score) can be compiled at the same time.
+#
+# The ASCII notation is just another front end for cyclemidi: each voice compiles into a
+# cyclemidi Voice (a list of Notes with start/end times measured in cycles) and
+# cyclemidi.build_midi_file turns those into MIDI.
+###
 
+REST_SYMBOLS = ('---', '--')
+TIE_SYMBOLS = ('===', '==')
+ONE = Decimal(1)
 
-def ascii_to_midi(asciis, config):
-    "Assumes asciis is a list of strings and each has same number of newlines"""
-    mid = MidiFile()
-    channel = 0
-    ticks_per_symbol = mid.ticks_per_beat // config.symbols_per_beat
+def swing_timing(config, ticks_per_beat):
+    """
+    Returns the (left_start, left_end, right_start, right_end) tick offsets used for the
+    left and right symbols of each pair.
+    """
+    ticks_per_symbol = ticks_per_beat // config.symbols_per_beat
     ticks_per_pair = 2 * ticks_per_symbol
-    tempo = bpm2tempo(config.beats_per_minute)
-    global rest_length
+    left_swing = config.swing * ticks_per_pair
+    right_swing = (1 - config.swing) * ticks_per_pair
+    left_end = right_end = int(config.note_width * right_swing)
+    left_start = int(right_swing - right_end)
+    right_start = int(left_swing - left_end)
+
+    return (left_start, left_end, right_start, right_end)
 
+def split_voices(asciis):
+    """
+    Joins a list of scores (strings with the same number of newlines) end to end and
+    returns one string per voice, bottom voice first so that it ends up on channel 0.
+    """
     # if single str, wrap in list
     if isinstance(asciis, str):
         asciis = [asciis]
@@ -58,37 +52,222 @@ def ascii_to_midi(asciis, config):
     zipped = zip(*split_by_newline)
     music = '\n'.join([' '.join(z) for z in zipped])
 
-    left_swing = config.swing * ticks_per_pair
-    right_swing = (1 - config.swing) * ticks_per_pair
-    left_end = right_end = int(config.note_width * right_swing)
-    left_start = int(right_swing - right_end)
-    right_start = int(left_swing - left_end)
+    return list(reversed(music.strip().split('\n')))
+
+class VoiceCompiler:
+    """
+    Compiles one voice a symbol at a time.  feed() yields notes as soon as they're final:
+    a note can be extended by ties (even after rests) so it's only final once the next
+    note starts, or when finish() is called.  Symbols are handled in (left, right) pairs
+    so an unpaired trailing symbol is dropped.
+    """
+    def __init__(self, timing, cycle_ticks):
+        self.timing = timing
+        self.cycle_ticks = cycle_ticks
+        self.symbol_count = 0
+        self.unpaired = None
+        self.now = 0  # absolute tick at which the previous note (or tie) ended
+        self.rest_length = 0
+        self.note = None  # (on tick, symbol) of the latest note, not yet final so it ends at now
+
+    def feed(self, symbol):
+        if self.unpaired is None:
+            self.unpaired = symbol
+            return
+        (left_start, left_end, right_start, right_end) = self.timing
+        left = self.unpaired
+        self.unpaired = None
+        yield from self.process_symbol(left, 0 if self.symbol_count == 0 else left_start, left_end)
+        yield from self.process_symbol(symbol, right_start, right_end)
+        self.symbol_count += 2
 
-    # reversed() so that the "bottom" voice is channel 0
-    max_symbol_count = 0
-    for voice in reversed(music.strip().split('\n')):
-        track = MidiTrack()
-        track.append(MetaMessage('set_tempo', tempo=tempo))
-        symbols = WS_RE.split(voice.strip())
-        symbol_pairs = list(zip(symbols[0::2], symbols[1::2]))
-        max_symbol_count = max(max_symbol_count, len(symbol_pairs) * 2)
-
-        is_first_pair = True
-        for (left, right) in symbol_pairs:
-            process_symbol(track, channel, left, 0 if is_first_pair else left_start, left_end)
-            process_symbol(track, channel, right, right_start, right_end)
-            is_first_pair = False
-
-        mid.tracks.append(track)
-        channel += 1
-        rest_length = 0
+    def finish(self):
+        if self.note is not None:
+            (on, symbol) = self.note
+            self.note = None
+            # width 1 because the symbol timings already account for the note width
+            yield Note(Fraction(on, self.cycle_ticks), Fraction(self.now, self.cycle_ticks), symbol, width=ONE)
 
+    def process_symbol(self, symbol, symbol_start, symbol_end):
+        if symbol in REST_SYMBOLS:
+            self.rest_length += symbol_start + symbol_end
+        elif symbol in TIE_SYMBOLS:
+            # a tie extends the previous note by this symbol's time, even if there have
+            # been rests since, and swallows those rests
+            self.now += symbol_start + symbol_end
+            self.rest_length = 0
+        else:
+            yield from self.finish()
+            on = self.now + self.rest_length + symbol_start
+            self.now = on + symbol_end
+            self.rest_length = 0
+            self.note = (on, symbol)
+
+def voice_to_timeline(voice, timing, cycle_ticks):
+    """
+    Compiles one voice into a cyclemidi Voice, returns the voice and the number of symbols
+    in it.
+    """
+    compiler = VoiceCompiler(timing, cycle_ticks)
+    notes = []
+    for symbol in WS_RE.split(voice.strip()):
+        notes.extend(compiler.feed(symbol))
+    notes.extend(compiler.finish())
+
+    return (notes, compiler.symbol_count)
+
+def voice_jobs(asciis, config, ticks_per_beat):
+    timing = swing_timing(config, ticks_per_beat)
+    cycle_ticks = ticks_per_cycle(config, ticks_per_beat)
+    return [(voice, timing, cycle_ticks) for voice in split_voices(asciis)]
+
+def run_voice_job(job):
+    return voice_to_timeline(*job)
+
+def total_secs(symbol_counts, config, ticks_per_beat):
+    ticks_per_symbol = ticks_per_beat // config.symbols_per_beat
+    tempo = bpm2tempo(config.beats_per_minute)
+    return tick2second(max(symbol_counts, default=0) * ticks_per_symbol, ticks_per_beat, tempo)
+
+def ascii_to_voices(asciis, config):
+    """
+    Compiles a score into cyclemidi voices (bottom voice first), returns the voices and
+    the length of the score in seconds.
+    """
+    ticks_per_beat = MidiFile().ticks_per_beat
+    compiled = [run_voice_job(job) for job in voice_jobs(asciis, config, ticks_per_beat)]
+    voices = [voice for (voice, symbol_count) in compiled]
+    return (voices, total_secs([symbol_count for (voice, symbol_count) in compiled], config, ticks_per_beat))
+
+def assemble_midi(compiled_voices, config, ticks_per_beat):
+    voices = [voice for (voice, symbol_count) in compiled_voices]
+    symbol_counts = [symbol_count for (voice, symbol_count) in compiled_voices]
+    return (build_midi_file(voices, config), total_secs(symbol_counts, config, ticks_per_beat))
+
+def compile_ascii(asciis, config):
+    "Like ascii_to_midi but doesn't write the MIDI file"""
+    (voices, secs) = ascii_to_voices(asciis, config)
+    return (build_midi_file(voices, config), secs)
+
+def ascii_to_midi(asciis, config):
+    "Assumes asciis is a list of strings and each has same number of newlines"""
+    (mid, secs) = compile_ascii(asciis, config)
     mid.save(config.midi_file_name)
 
-    return (mid, tick2second(max_symbol_count * ticks_per_symbol, mid.ticks_per_beat, tempo))
+    return (mid, secs)
 
-def play_ascii(asciis, config):
-    (ignore, total_secs) = ascii_to_midi(asciis, config)
-    play_midi(config, total_secs)
+def render_many(scores, config, max_workers=None, processes=True):
+    """
+    Compiles a list of scores (each one what ascii_to_midi takes) using a pool of worker
+    processes (or threads, if processes is False), returns a list of (MidiFile, total_secs)
+    in the same order as the scores.  Every voice of every score is a separate job so even
+    a single score with many voices gets spread across the pool.  Nothing is saved.
+
+    max_workers defaults to the number of CPUs, with only one worker the scores are
+    compiled in this process since a pool would only add overhead.
+    """
+    ticks_per_beat = MidiFile().ticks_per_beat
+    jobs_by_score = [voice_jobs(asciis, config, ticks_per_beat) for asciis in scores]
+    all_jobs = [job for jobs in jobs_by_score for job in jobs]
+
+    workers = max_workers or os.cpu_count() or 1
+    if workers == 1:
+        compiled = iter([run_voice_job(job) for job in all_jobs])
+    else:
+        executor = process_pool(workers) if processes else ThreadPoolExecutor(max_workers=workers)
+        with executor:
+            compiled = iter(executor.map(run_voice_job, all_jobs, chunksize=max(1, len(all_jobs) // 64)))
+
+    return [
+        assemble_midi([next(compiled) for job in jobs], config, ticks_per_beat)
+        for jobs in jobs_by_score
+    ]
+
+def read_systems(lines):
+    """
+    Groups lines into systems: runs of non-blank lines (one per voice, top voice first)
+    separated by blank lines, which is how print_ascii() lays out a piece.
+    """
+    system = []
+    for line in lines:
+        if line.strip():
+            system.append(line)
+        elif system:
+            yield system
+            system = []
+    if system:
+        yield system
+
+class AsciiStream:
+    """
+    Compiles a score one system at a time: iterating yields (channel, note) as soon as
+    each note is final.  lines can be any iterable of lines (e.g. an open file) so memory
+    use is bounded by one system rather than the whole piece.  Systems are joined end to
+    end, as if they had been passed to ascii_to_midi as a list.
+    """
+    def __init__(self, lines, config, ticks_per_beat=480):
+        self.lines = lines
+        self.timing = swing_timing(config, ticks_per_beat)
+        self.cycle_ticks = ticks_per_cycle(config, ticks_per_beat)
+        self.compilers = []
 
+    def __iter__(self):
+        for system in read_systems(self.lines):
+            if not self.compilers:
+                self.compilers = [VoiceCompiler(self.timing, self.cycle_ticks) for layer in system]
+            assert len(system) == len(self.compilers), "every system needs the same number of voices"
+            # reversed so that the "bottom" voice is channel 0
+            for channel, layer in enumerate(reversed(system)):
+                for symbol in layer.split():
+                    for note in self.compilers[channel].feed(symbol):
+                        yield (channel, note)
 
+        for channel, compiler in enumerate(self.compilers):
+            for note in compiler.finish():
+                yield (channel, note)
+
+    @property
+    def voice_count(self):
+        return len(self.compilers)
+
+    @property
+    def symbol_count(self):
+        """
+        Number of symbols in the longest voice so far.
+        """
+        return max((compiler.symbol_count for compiler in self.compilers), default=0)
+
+def ascii_file_to_midi(file_name, config):
+    """
+    Like ascii_to_midi but streams the score from a file (see AsciiStream), appending
+    each note to its track as soon as it's final.
+    """
+    mid = MidiFile()
+    cycle_ticks = ticks_per_cycle(config, mid.ticks_per_beat)
+    prev_note_ends = []
+
+    def add_tracks(count):
+        while len(mid.tracks) < count:
+            mid.tracks.append(new_track(config))
+            prev_note_ends.append(0)
+
+    with open(file_name) as f:
+        stream = AsciiStream(f, config, mid.ticks_per_beat)
+        for (channel, note) in stream:
+            add_tracks(channel + 1)
+            prev_note_ends[channel] = append_note(
+                mid.tracks[channel], note, channel, prev_note_ends[channel], config, cycle_ticks
+            )
+        add_tracks(stream.voice_count)
+
+    mid.save(config.midi_file_name)
+
+    return (mid, total_secs([stream.symbol_count], config, mid.ticks_per_beat))
+
+def play_ascii_file(file_name, config):
+    (ignore, secs) = ascii_file_to_midi(file_name, config)
+    play_midi(config, secs)
+
+def play_ascii(asciis, config):
+    (ignore, secs) = ascii_to_midi(asciis, config)
+    play_midi(config, secs)
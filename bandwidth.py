@@ -0,0 +1,221 @@
+from dataclasses import dataclass
+from math import floor
+from typing import Optional
+
+from mido import Message, MetaMessage  # type: ignore
+
+###
+# 5-pin DIN MIDI runs at 31250 baud and every byte on the wire costs 10 bits (start bit,
+# 8 data bits, stop bit) so a port can move 3125 bytes, roughly 1000 three-byte messages,
+# per second.  Anything scheduled faster than that queues up in the interface and smears.
+###
+
+DIN_BAUD = 31250
+BITS_PER_BYTE = 10
+DIN_BYTES_PER_SECOND = DIN_BAUD // BITS_PER_BYTE
+
+
+@dataclass
+class CycleLoad:
+    cycle: int
+    byte_count: int
+    max_delay: (
+        float  # seconds the most delayed message in this cycle waited for the wire
+    )
+
+
+@dataclass
+class BandwidthReport:
+    window_ms: float
+    bytes_per_second_budget: int
+    peak_events_per_window: int
+    peak_window_start: float
+    peak_bytes_per_second: float
+    port_bytes_per_second: dict[str, float]
+    peak_polyphony: int
+    max_delay: float
+    worst_cycles: list[CycleLoad]
+
+    def summary(self) -> str:
+        lines = [
+            f"peak events per {self.window_ms}ms window: {self.peak_events_per_window}"
+            f" (at {self.peak_window_start:.3f}s)",
+            f"peak rate: {self.peak_bytes_per_second:.0f} bytes/s"
+            f" (budget {self.bytes_per_second_budget} bytes/s)",
+        ]
+        for port, rate in self.port_bytes_per_second.items():
+            lines.append(f"{port}: {rate:.0f} bytes/s average")
+        lines.append(f"peak polyphony: {self.peak_polyphony}")
+        lines.append(f"max delay: {self.max_delay * 1000:.2f}ms")
+        for load in self.worst_cycles:
+            lines.append(
+                f"cycle {load.cycle}: {load.byte_count} bytes,"
+                f" max delay {load.max_delay * 1000:.2f}ms"
+            )
+        return "\n".join(lines)
+
+
+def message_size(message: Message) -> int:
+    """
+    Bytes the message occupies on the wire.  Running status is ignored so this errs on the
+    side of over-estimating.
+    """
+    return len(message.bytes())
+
+
+def is_note_on(message: Message) -> bool:
+    return bool(message.type == "note_on" and message.velocity > 0)
+
+
+def is_note_off(message: Message) -> bool:
+    return bool(
+        message.type == "note_off"
+        or (message.type == "note_on" and message.velocity == 0)
+    )
+
+
+def wire_messages(messages: list[Message]) -> list[Message]:
+    """
+    Meta messages never leave the process so they don't count against the wire.
+    """
+    return [m for m in messages if not isinstance(m, MetaMessage)]
+
+
+def queue_delays(messages: list[Message], bytes_per_second: int) -> list[float]:
+    """
+    Simulates a serial link that sends one message at a time and returns, for every
+    message, how long it waited behind earlier messages before it could start sending.
+
+    Expects message.time to be an absolute, 0-based offset in seconds (i.e. the output of
+    add_clock_messages).
+    """
+    delays = []
+    link_free_at = 0.0
+    for message in messages:
+        send_at = max(message.time, link_free_at)
+        delays.append(send_at - message.time)
+        link_free_at = send_at + message_size(message) / bytes_per_second
+    return delays
+
+
+def peak_window(messages: list[Message], window_secs: float) -> tuple[int, float, int]:
+    """
+    Sliding window over the (time sorted) messages that finds the window containing the
+    most events.  Returns the event count, the window's start time and its byte count.
+    """
+    peak_count = 0
+    peak_start = 0.0
+    peak_bytes = 0
+    window_bytes = 0
+    left = 0
+    for right, message in enumerate(messages):
+        window_bytes += message_size(message)
+        while messages[left].time <= message.time - window_secs:
+            window_bytes -= message_size(messages[left])
+            left += 1
+        if right - left + 1 > peak_count:
+            peak_count = right - left + 1
+            peak_start = messages[left].time
+            peak_bytes = window_bytes
+    return (peak_count, peak_start, peak_bytes)
+
+
+def peak_polyphony(messages: list[Message]) -> int:
+    sounding: set[tuple[int, int]] = set()
+    peak = 0
+    for message in messages:
+        if is_note_on(message):
+            sounding.add((message.channel, message.note))
+            peak = max(peak, len(sounding))
+        elif is_note_off(message):
+            sounding.discard((message.channel, message.note))
+    return peak
+
+
+def analyze_bandwidth(
+    messages: list[Message],
+    ports: list[str],
+    seconds_per_cycle: float,
+    bytes_per_second: int = DIN_BYTES_PER_SECOND,
+    window_ms: float = 1.0,
+    worst_cycle_count: int = 4,
+) -> BandwidthReport:
+    """
+    Takes the absolute-time message list that multi_port_play sends (notes and clock
+    messages) and reports how hard it pushes each port.  Every port receives every
+    message so the per-port rates are the same but are reported separately to make
+    it obvious which devices are affected.
+    """
+    sent = wire_messages(messages)
+    window_secs = window_ms / 1000
+    (peak_count, peak_start, peak_bytes) = peak_window(sent, window_secs)
+    delays = queue_delays(sent, bytes_per_second)
+
+    total_bytes = sum(message_size(m) for m in sent)
+    duration = max(sent[-1].time if sent else 0.0, window_secs)
+    port_rate = total_bytes / duration
+
+    cycle_loads: dict[int, CycleLoad] = {}
+    for message, delay in zip(sent, delays):
+        cycle = floor(message.time / seconds_per_cycle)
+        load = cycle_loads.setdefault(cycle, CycleLoad(cycle, 0, 0.0))
+        load.byte_count += message_size(message)
+        load.max_delay = max(load.max_delay, delay)
+
+    worst_cycles = sorted(
+        (load for load in cycle_loads.values() if load.max_delay > 0),
+        key=lambda load: (-load.max_delay, load.cycle),
+    )[:worst_cycle_count]
+
+    return BandwidthReport(
+        window_ms=window_ms,
+        bytes_per_second_budget=bytes_per_second,
+        peak_events_per_window=peak_count,
+        peak_window_start=peak_start,
+        peak_bytes_per_second=peak_bytes / window_secs,
+        port_bytes_per_second={port: port_rate for port in ports},
+        peak_polyphony=peak_polyphony(sent),
+        max_delay=max(delays, default=0.0),
+        worst_cycles=worst_cycles,
+    )
+
+
+def stagger_messages(
+    messages: list[Message],
+    bytes_per_second: int = DIN_BYTES_PER_SECOND,
+    max_delay: Optional[float] = None,
+) -> list[Message]:
+    """
+    Returns copies of the (absolute time) messages rescheduled so that no message is sent
+    before the link has finished sending the previous one, i.e. simultaneous events are
+    spread out instead of piling up in the interface.
+
+    If max_delay is given, notes that would be pushed back further than that are thinned
+    out instead: the note_on and its matching note_off are dropped.  Clock and transport
+    messages are always kept because dropping them would change the tempo downstream.
+    """
+    staggered = []
+    dropped: set[tuple[int, int]] = set()
+    link_free_at = 0.0
+    for message in messages:
+        if isinstance(message, MetaMessage):
+            staggered.append(message)
+            continue
+
+        if is_note_off(message) and (message.channel, message.note) in dropped:
+            dropped.discard((message.channel, message.note))
+            continue
+
+        send_at = max(message.time, link_free_at)
+        if (
+            max_delay is not None
+            and is_note_on(message)
+            and send_at - message.time > max_delay
+        ):
+            dropped.add((message.channel, message.note))
+            continue
+
+        staggered.append(message.copy(time=send_at))
+        link_free_at = send_at + message_size(message) / bytes_per_second
+
+    return staggered
@@ -0,0 +1,235 @@
+"""
+Rough timings for the hot paths.  Run all of them with `python benchmarks.py` or just
+some with e.g. `python benchmarks.py transpose`.
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+from typing import Callable
+
+benchmarks: dict[str, Callable[[], None]] = {}
+
+BENCH_MIDI_FILE = os.path.join(tempfile.gettempdir(), "bench.mid")
+
+
+def benchmark(func: Callable[[], None]) -> Callable[[], None]:
+    benchmarks[func.__name__.removeprefix("bench_")] = func
+    return func
+
+
+def report(label: str, secs: float, count: int, unit: str) -> None:
+    print(f"  {label:<24} {secs:8.4f}s  {count / secs:14,.0f} {unit}/s")
+
+
+@benchmark
+def bench_transpose() -> None:
+    from note_util import n, set_key, add_scale_steps_batch, add_semitones_batch
+
+    set_key("G major")
+    progression = [n(p) for p in ("G3", "B3", "D4", "F#4", "A4", "C4", "E4")] * 1000
+    steps = [i % 15 - 7 for i in range(len(progression))]
+    count = len(progression)
+    number = 20
+
+    secs = timeit.timeit(
+        lambda: [note + step for note, step in zip(progression, steps)], number=number
+    )
+    report("scalar scale steps", secs, count * number, "notes")
+    secs = timeit.timeit(
+        lambda: add_scale_steps_batch(progression, steps), number=number
+    )
+    report("batch scale steps", secs, count * number, "notes")
+
+    secs = timeit.timeit(lambda: [note + "P5" for note in progression], number=number)
+    report("scalar semitones", secs, count * number, "notes")
+    secs = timeit.timeit(lambda: add_semitones_batch(progression, 7), number=number)
+    report("batch semitones", secs, count * number, "notes")
+
+
+@benchmark
+def bench_render_many() -> None:
+    from asciimidi import compile_ascii, render_many
+    from midi import Config
+
+    config = Config()
+    bar = "C4 E4 G4 -- C5 == B4 -- A4 F4 == D4 -- E4 G4 =="
+    score = "\n".join([" ".join([bar] * 200)] * 4)
+    scores = [score] * 32
+    count = len(scores)
+
+    secs = timeit.timeit(lambda: [compile_ascii(s, config) for s in scores], number=1)
+    report("serial", secs, count, "scores")
+    # with one worker render_many doesn't use a pool, which is the serial timing
+    for workers in sorted({2, os.cpu_count() or 2} - {1}):
+        secs = timeit.timeit(
+            lambda: render_many(scores, config, max_workers=workers), number=1
+        )
+        report(f"{workers} processes", secs, count, "scores")
+
+
+@benchmark
+def bench_ascii() -> None:
+    from asciimidi import compile_ascii
+    from legacy_asciimidi import legacy_ascii_to_midi
+    from midi import Config
+
+    config = Config()
+    bar = "C4 E4 G4 -- C5 == B4 -- A4 F4 == D4 -- E4 G4 =="
+    score = "\n".join([" ".join([bar] * 100)] * 4)
+    count = 4 * 1600
+    number = 5
+
+    secs = min(
+        timeit.repeat(lambda: legacy_ascii_to_midi([score], config), number=number)
+    )
+    report("legacy emitter", secs, count * number, "symbols")
+    secs = min(timeit.repeat(lambda: compile_ascii(score, config), number=number))
+    report("cyclemidi timeline", secs, count * number, "symbols")
+
+
+@benchmark
+def bench_score() -> None:
+    from note_util import Score, concat
+
+    bar = "C4 E4 G4 -- C5 == B4 --\nC3 == == == G2 == == =="
+    for count in (500, 2000):
+
+        def concat_piece() -> None:
+            piece = bar
+            for _ in range(count - 1):
+                piece = concat(piece, bar)
+
+        secs = timeit.timeit(concat_piece, number=1)
+        report(f"concat x{count}", secs, count, "measures")
+        secs = timeit.timeit(lambda: Score().add([bar] * count).text(), number=1)
+        report(f"Score x{count}", secs, count, "measures")
+
+
+@benchmark
+def bench_render() -> None:
+    from cyclemidi import notes
+    from render import render_voices
+
+    cycles = (
+        notes("[C4,E4,G4 [D4,F4,A4 B3,D4,G4]] " * 64)
+        .stack()
+        .notes("[C2 C2 G2 C3] [E2 - G2 -] " * 32)
+        .set_config("midi_file_name", BENCH_MIDI_FILE)
+        .midi()
+    )
+    secs = timeit.timeit(
+        lambda: render_voices(cycles.voices, cycles.config, cycles.total_secs), number=1
+    )
+    report("synth", secs, cycles.total_secs, "audio secs")
+    print(f"  {cycles.total_secs / secs:.0f}x faster than real time")
+
+
+@benchmark
+def bench_play() -> None:
+    import contextlib
+    import io
+    from cyclemidi import notes
+    from midi import multi_port_play, VirtualClock, RecordingPort
+
+    cycles = (
+        notes("[C4,E4,G4 [D4,F4,A4 B3,D4,G4]] " * 64)
+        .stack()
+        .notes("[C2 C2 G2 C3] [E2 - G2 -] " * 32)
+        .set_config("midi_file_name", BENCH_MIDI_FILE)
+        .midi()
+    )
+    clock = VirtualClock()
+    ports = [RecordingPort(clock), RecordingPort(clock)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        stats = multi_port_play(ports, cycles.config, cycles.total_secs, clock, loops=4)
+    report("virtual clock", stats.overhead_secs, stats.events, "events")
+    print(f"  {stats.overhead_per_event * 1e6:.1f}us scheduling overhead per event")
+
+
+@benchmark
+def bench_parallel_compile() -> None:
+    from cyclemidi import Cycles, parse_cache, parse_cycle_lists
+
+    cycles = Cycles()
+    for i in range(8):
+        if i:
+            cycles.stack()
+        octave = 2 + i % 4
+        bar = f"[C{octave},E{octave} [D{octave},F{octave} B{octave - 1},D{octave}]] "
+        cycles.notes(bar * 256).velocity("[5,5 9,9] [5,5 [6,6 7,7]] " * 128).stack()
+        cycles.rhythm("[x [x x] ~ x] [x ~ [x x x] x] " * 128).notes(
+            f"[C{octave} [D{octave} - B{octave}]] " * 256
+        )
+
+    for workers in sorted({1, 2, os.cpu_count() or 1}):
+        # otherwise every timing after the first would just be cache hits
+        parse_cache.clear()
+        secs = timeit.timeit(
+            lambda: parse_cycle_lists(cycles.cycle_lists, workers), number=1
+        )
+        report(f"{workers} workers", secs, 16, "stacks")
+
+
+@benchmark
+def bench_chunked_compile() -> None:
+    from cyclemidi import CycleListType, generate_lane
+
+    cycle_list = "[C4,E4 [D4 - F4,G4] ~ [- A4,B4]] [- [E4 -] C4,- D4] " * 2000
+    for workers in sorted({1, 2, os.cpu_count() or 1}):
+        secs = timeit.timeit(
+            lambda: generate_lane(cycle_list, CycleListType.NOTES, workers), number=1
+        )
+        report(f"{workers} workers", secs, 4000, "cycles")
+
+
+@benchmark
+def bench_repeated_bars() -> None:
+    from cyclemidi import CycleListType, generate_lane, notes
+
+    def bar(i: int) -> str:
+        return f"[C{i % 7 + 1},E4 [D4 {i % 127} F4,G4] ~ [A4 B4,{i // 127 % 127}]] "
+
+    for distinct in (8, 4000):
+        cycle_list = "".join(bar(i % distinct) for i in range(4000))
+        secs = timeit.timeit(
+            lambda: generate_lane(cycle_list, CycleListType.NOTES), number=1
+        )
+        ratio = notes(cycle_list).sharing_stats().sharing_ratio
+        report(f"{distinct} distinct bars", secs, 4000, "cycles")
+        print(f"  sharing ratio {ratio:.1f}")
+
+
+@benchmark
+def bench_wide_polyphony() -> None:
+    from cyclemidi import CycleListType, generate_lane, parse_cycle_lists
+
+    chord = ",".join(f"{pitch}{octave}" for octave in (3, 4, 5) for pitch in "CEG")
+    rest = ",".join(["-"] * 9)
+
+    def nest(depth: int, i: int) -> str:
+        if depth == 0:
+            return chord
+        return f"[{chord} {nest(depth - 1, i)} {rest} C{i % 7 + 1}{chord[2:]}]"
+
+    for depth in (2, 6):
+        cycle_list = "".join(nest(depth, i) + " " for i in range(200))
+        secs = timeit.timeit(
+            lambda: generate_lane(cycle_list, CycleListType.NOTES), number=1
+        )
+        report(f"depth {depth} parse", secs, 200, "cycles")
+        lanes = [(CycleListType.NOTES, cycle_list)]
+        parse_cycle_lists(lanes)
+        secs = timeit.timeit(lambda: parse_cycle_lists(lanes), number=1)
+        report(f"depth {depth} cached", secs, 200, "cycles")
+
+
+def main(names: list[str]) -> None:
+    for name in names or list(benchmarks):
+        print(name)
+        benchmarks[name]()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,16 +1,26 @@
 from __future__ import annotations  # so that Cycles methods can return Cycles instances
-from dataclasses import dataclass, replace
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
 from decimal import Decimal
 from fractions import Fraction
+from functools import lru_cache
 from enum import Enum, auto
-from typing import Any, Union, Optional
+from typing import Any, Iterable, Iterator, Optional, Sequence, Union
 from string import whitespace
-from math import lcm, floor
+from math import ceil, floor, lcm
 import re
+import sys
 
 from mido import MidiFile, bpm2tempo, tick2second, MidiTrack, Message, MetaMessage  # type: ignore
 
-from midi import get_midi_note_and_velocity, play_midi, Config
+from bandwidth import BandwidthReport, analyze_bandwidth, DIN_BYTES_PER_SECOND
+from midi import (
+    get_midi_note_and_velocity,
+    play_midi,
+    add_clock_messages,
+    process_pool,
+    Config,
+)
 
 
 class CycleListType(Enum):
@@ -24,7 +34,31 @@ class CycleListType(Enum):
 
 @dataclass
 class TreeNode:
-    children: list[Union[TreeNode | str]]
+    children: list[Union[TreeNode, str, Repeat]]
+
+
+@dataclass
+class Repeat:
+    """
+    child repeated count times, each repeat taking a step (`!` or `@`).  `*` (repeats
+    squeezed into one step) is a subtree holding a Repeat.  The repeats are only expanded
+    when voices are generated.
+    """
+
+    child: Union[TreeNode, str, Repeat]
+    count: int
+
+
+@dataclass
+class SharingStats:
+    # subtrees in the cycle list, counting every repeat
+    subtrees: int = 0
+    # structurally different subtrees, i.e. how many have voices generated for them
+    distinct_subtrees: int = 0
+
+    @property
+    def sharing_ratio(self) -> float:
+        return self.subtrees / self.distinct_subtrees if self.distinct_subtrees else 1.0
 
 
 @dataclass
@@ -42,6 +76,9 @@ CycleList = tuple[CycleListType, str]
 
 REST_LITERAL = "~"
 TIE_LITERAL = "-"
+# e.g. C4*4 (four C4s in one step), C4!3 (three steps of C4) and [ C4 ~ ]@16 (sixteen
+# cycles of [ C4 ~ ], `@` is the same as `!` but reads better after whole cycles)
+REPEAT_RE = re.compile(r"([*!@])(\d+)$")
 
 ###
 # Note: the public interface (`Cycles`) is object-orented and "fluent" but the actual processing is done
@@ -100,27 +137,82 @@ def expand_alternatives(s: str) -> str:
         return s
 
 
-def add_cycle_to_tree(tokens: list[str], tree: TreeNode) -> int:
+# structurally identical subtrees (and repeats) map to a single instance, keyed by their
+# children (strings, or the ids of already interned nodes)
+InternTable = dict[tuple[Any, ...], Union[TreeNode, Repeat]]
+
+
+def node_key(node: Union[TreeNode, str, Repeat]) -> Union[str, int]:
+    return node if isinstance(node, str) else id(node)
+
+
+def intern_node(node: Union[TreeNode, Repeat], interned: InternTable) -> Any:
+    """
+    Returns the instance of node in the table, adding node if it's the first of its
+    kind.  Only works bottom up: node's children must already have been interned.
+    """
+    if isinstance(node, Repeat):
+        key: tuple[Any, ...] = (Repeat, node_key(node.child), node.count)
+    else:
+        key = (TreeNode, tuple(node_key(child) for child in node.children))
+    return interned.setdefault(key, node)
+
+
+def parse_repeats(token: str) -> tuple[str, list[tuple[int, bool]]]:
+    """
+    Splits repeat suffixes off a token, returns what's left and (count, subdivide) for
+    each suffix, innermost first.
+    """
+    repeats: list[tuple[int, bool]] = []
+    m = REPEAT_RE.search(token)
+    while m is not None:
+        (op, count) = m.groups()
+        assert int(count) > 0
+        repeats.insert(0, (int(count), op == "*"))
+        token = token[: m.start()]
+        m = REPEAT_RE.search(token)
+
+    return (token, repeats)
+
+
+def add_cycle_to_tree(
+    tokens: list[str], tree: TreeNode, interned: Optional[InternTable] = None
+) -> int:
     """
     Adds the tokens of a single (potentially nested) cycle into an
-    existing tree.
+    existing tree and returns the number of tokens consumed.  Subtrees are interned
+    (see intern_node) as they're completed so identical subtrees are shared.
+
+    The subtrees that are still open are kept on a stack rather than recursing so
+    there's no limit on how deeply cycles can be nested.
     """
-    i = 0
-    token_count = len(tokens)
-    while i < token_count:
-        token = tokens[i]
+    interned = {} if interned is None else interned
+    open_trees = [tree]
+    for i, token in enumerate(tokens):
         if token == "[":  # this is subtree's open bracket
-            subtree = TreeNode([])
-            tokens_consumed = add_cycle_to_tree(tokens[i + 1 :], subtree)
-            tree.children.append(subtree)
-            i += tokens_consumed + 1
-        elif token == "]":  # this is tree's close bracket
-            return i + 1
+            open_trees.append(TreeNode([]))
+        elif token == "]":  # this is a close bracket...
+            if len(open_trees) == 1:  # ... for tree itself
+                return i + 1
+            subtree = open_trees.pop()
+            open_trees[-1].children.append(intern_node(subtree, interned))
         else:
-            tree.children.append(token)
-            i += 1
+            (value, repeats) = parse_repeats(token)
+            children = open_trees[-1].children
+            # a bare suffix (after a close bracket) repeats the previous child
+            child = children.pop() if value == "" else value
+            for count, subdivide in repeats:
+                child = intern_node(Repeat(child, count), interned)
+                if subdivide:
+                    child = intern_node(TreeNode([child]), interned)
+            children.append(child)
+
+    # subtrees that were never closed end with the tokens
+    while len(open_trees) > 1:
+        subtree = open_trees.pop()
+        open_trees[-1].children.append(intern_node(subtree, interned))
 
-    return i
+    return len(tokens)
 
 
 def split_cycles(cycle_list: str) -> list[str]:
@@ -128,45 +220,112 @@ def split_cycles(cycle_list: str) -> list[str]:
     The top level cycle list is a list of one or more cycles that we need to split up
     and parse into the same tree.
 
-    Lookahead and lookbehind groups ensure we preserve the brackets even while splitting
-    on them.
+    A cycle runs from an open bracket to its matching close bracket, plus anything
+    after that (e.g. a repeat suffix) up to the next top level open bracket.
     """
-    stripped_cycle_list = cycle_list.strip()
-    if stripped_cycle_list[0] == "[" and stripped_cycle_list[-1] == "]":
-        return [stripped_cycle_list]
-    else:
-        return re.split(r"(?<=\])\s*(?=\[)", cycle_list)
+    cycles = []
+    depth = 0
+    start = 0
+    closed = False  # whether the current cycle's outermost brackets have closed
+    for i, c in enumerate(cycle_list):
+        if c == "[":
+            if depth == 0 and closed:
+                cycles.append(cycle_list[start:i])
+                start = i
+                closed = False
+            depth += 1
+        elif c == "]":
+            # a stray close bracket doesn't open anything
+            depth = max(depth - 1, 0)
+            closed = closed or depth == 0
+    cycles.append(cycle_list[start:])
+
+    return cycles
 
 
 def build_cycle_tree(cycles: list[str]) -> TreeNode:
     cycle_tree = TreeNode([])
+    interned: InternTable = {}
 
     for cycle in cycles:
         tokens = tokenize(cycle)
-        add_cycle_to_tree(tokens, cycle_tree)
+        add_cycle_to_tree(tokens, cycle_tree, interned)
 
     return cycle_tree
 
 
-def normalize_voice_counts(
-    left: list[Voice], right: list[Voice]
-) -> tuple[list[Voice], list[Voice]]:
-    left_len = len(left)
-    right_len = len(right)
-    max_voice_count = max(left_len, right_len)
-    new_left = []
-    new_right = []
-    for i in range(max_voice_count):
-        new_left.append([] if i >= left_len else left[i])
-        new_right.append([] if i >= right_len else right[i])
+def repeated_children(
+    node: TreeNode,
+) -> list[tuple[Union[TreeNode, str], int]]:
+    """
+    Returns (child, number of steps it takes) for each child of node, with nested
+    Repeats multiplied out.
+    """
+    children = []
+    for child in node.children:
+        count = 1
+        while isinstance(child, Repeat):
+            count *= child.count
+            child = child.child
+        children.append((child, count))
+
+    return children
+
+
+def distinct_subtrees(tree: TreeNode) -> list[TreeNode]:
+    """
+    Every distinct subtree of tree (tree included) once, each one after all of its own
+    subtrees.  Shared subtrees and repeats aren't walked again.
+    """
+    ordered = []
+    seen: set[int] = set()
+    # (node, whether its subtrees have been ordered)
+    stack = [(tree, False)]
+    while stack:
+        (node, subtrees_ordered) = stack.pop()
+        if subtrees_ordered:
+            ordered.append(node)
+        elif id(node) not in seen:
+            seen.add(id(node))
+            stack.append((node, True))
+            stack.extend(
+                (child, False)
+                for child, _ in repeated_children(node)
+                if isinstance(child, TreeNode)
+            )
+
+    return ordered
+
+
+def sharing_stats(tree: TreeNode) -> SharingStats:
+    """
+    Counts how much of the tree is shared (by interning and repeats).
+    """
+    # number of subtrees below each distinct subtree
+    counts: dict[int, int] = {}
+    for node in distinct_subtrees(tree):
+        counts[id(node)] = sum(
+            count * (1 + counts[id(child)])
+            for child, count in repeated_children(node)
+            if isinstance(child, TreeNode)
+        )
+
+    # less one for the root
+    return SharingStats(counts[id(tree)], len(counts) - 1)
 
-    return (new_left, new_right)
 
+def expand_repeats(
+    children: list[Union[TreeNode, str, Repeat]],
+) -> list[Union[TreeNode, str]]:
+    """
+    Returns one child per step.  The repeated children aren't copied, the same child
+    just appears more than once.
+    """
+    expanded: list[Union[TreeNode, str]] = []
+    for child, count in repeated_children(TreeNode(children)):
+        expanded.extend([child] * count)
 
-def extend_voices(left: list[Voice], right: list[Voice]) -> list[Voice]:
-    (left, right) = normalize_voice_counts(left, right)
-    assert len(left) == len(right)
-    return [left[i] + right[i] for i in range(len(left))]
+    return expanded
 
 
 def calc_voice_lengths(voices: list[Voice]) -> list[int]:
@@ -206,22 +365,241 @@ def calc_desired_voice_length(voices: list[Voice]) -> int:
 def normalize_voice_length(
     voices: list[Voice], desired_voice_length: int
 ) -> list[Voice]:
+    """
+    Repeats each voice out to desired_voice_length cycles.  The first repetition is the
+    voice's own notes (not copies) so a voice that's already long enough costs nothing.
+    """
     voice_lengths = calc_voice_lengths(voices)
 
     new_voices = []
-    for i, voice in enumerate(voices):
-        new_voice = []
-        for j in range(desired_voice_length // voice_lengths[i]):
-            offset = j * voice_lengths[i]
-            for note in voice:
-                new_voice.append(
-                    replace(note, start=note.start + offset, end=note.end + offset)
-                )
+    for voice, voice_length in zip(voices, voice_lengths):
+        new_voice = list(voice)
+        for offset in range(voice_length, desired_voice_length, voice_length):
+            new_voice.extend(
+                replace(note, start=note.start + offset, end=note.end + offset)
+                for note in voice
+            )
         new_voices.append(new_voice)
 
     return new_voices
 
 
+# voices generated for each shared subtree (by id) in the span [0, 1), along with the
+# leading ties (see generate_level) of each voice
+VoiceMemo = dict[int, tuple[list[Fraction], list[Voice]]]
+
+
+def shared_subtrees(tree: TreeNode) -> set[int]:
+    """
+    Ids of the subtrees that are used more than once (repeated, or interned and used in
+    more than one place).  These are worth generating once and copying into place,
+    everything else is generated in place.
+    """
+    used: set[int] = set()
+    shared: set[int] = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        for child in expand_repeats(node.children):
+            if isinstance(child, TreeNode):
+                if id(child) in used:
+                    shared.add(id(child))
+                else:
+                    used.add(id(child))
+                    stack.append(child)
+    return shared
+
+
+def add_tie(
+    voices: list[Voice], leading_ties: list[Fraction], i: int, duration: Fraction
+) -> None:
+    """
+    Ties extend the previous note in their voice, if there isn't one (yet) at this
+    level they're passed up as leading ties.
+    """
+    if len(voices) > i and len(voices[i]) > 0:
+        voices[i][-1].end += duration
+    else:
+        leading_ties.extend([Fraction(0)] * (i + 1 - len(leading_ties)))
+        leading_ties[i] += duration
+
+
+def place_notes(voice: Voice, start: Fraction, scale: Fraction) -> Iterator[Note]:
+    """
+    Copies of the notes of a voice generated in [0, 1) moved into [start, start + scale).
+    """
+    if scale == 1:
+        # the common case of whole cycles, skip the multiplications
+        for note in voice:
+            yield Note(
+                start + note.start,
+                start + note.end,
+                note.pitch,
+                note.velocity,
+                note.width,
+                note.offset,
+            )
+    else:
+        for note in voice:
+            yield Note(
+                start + note.start * scale,
+                start + note.end * scale,
+                note.pitch,
+                note.velocity,
+                note.width,
+                note.offset,
+            )
+
+
+@dataclass
+class Level:
+    """
+    A subtree part way through being generated: its children are spread over
+    [start, start + increment * len(children)) and their notes appended to voices.
+    """
+
+    children: list[Union[TreeNode, str]]
+    start: Fraction
+    increment: Fraction
+    voices: list[Voice]
+    leading_ties: list[Fraction] = field(default_factory=list)
+    next_child: int = 0
+    # a shared subtree is generated in [0, 1) into its own voices, memoized under its
+    # id, and then copied into its parent level at place_start
+    memo_key: Optional[int] = None
+    place_start: Fraction = Fraction(0)
+
+
+def subtree_level(
+    tree: TreeNode,
+    start: Fraction,
+    span: Fraction,
+    voices: list[Voice],
+    memo_key: Optional[int] = None,
+) -> Level:
+    children = expand_repeats(tree.children)
+    return Level(children, start, span / len(children), voices, memo_key=memo_key)
+
+
+def place_shared(
+    level: Level, memoized: tuple[list[Fraction], list[Voice]], child_start: Fraction
+) -> None:
+    """
+    Copies a shared subtree's memoized voices into the step of level at child_start.
+    """
+    (child_ties, child_voices) = memoized
+    for j, tie in enumerate(child_ties):
+        if tie:
+            add_tie(level.voices, level.leading_ties, j, tie * level.increment)
+    for j, child_voice in enumerate(child_voices):
+        if j == len(level.voices):
+            level.voices.append([])
+        level.voices[j].extend(place_notes(child_voice, child_start, level.increment))
+
+
+def finish_level(level: Level, parent: Level, memo: VoiceMemo) -> None:
+    if level.memo_key is None:
+        # the level shared its parent's voices, so its leading ties are the parent's too
+        parent_ties = parent.leading_ties
+        parent_ties.extend([Fraction(0)] * (len(level.leading_ties) - len(parent_ties)))
+        for j, tie in enumerate(level.leading_ties):
+            parent_ties[j] += tie
+    else:
+        memo[level.memo_key] = (level.leading_ties, level.voices)
+        place_shared(parent, memo[level.memo_key], level.place_start)
+
+
+def add_leaf(
+    level: Level,
+    leaf: str,
+    child_start: Fraction,
+    child_end: Fraction,
+    cycle_list_type: CycleListType,
+) -> None:
+    voices = level.voices
+    note_values = leaf.split(",")
+    missing_voice_count = len(note_values) - len(voices)
+    if missing_voice_count > 0:
+        for i in range(missing_voice_count):
+            voices.append([])
+    for i, note_value in enumerate(note_values):
+        note = Note(child_start, child_end)
+        if cycle_list_type == CycleListType.NOTES:
+            if note_value == TIE_LITERAL:
+                add_tie(voices, level.leading_ties, i, child_end - child_start)
+                continue
+            else:
+                note.pitch = note_value
+        elif cycle_list_type == CycleListType.RHYTHM:
+            # special case for rests in RHYTHM cycles
+            if note_value == REST_LITERAL:
+                note.pitch = note_value
+        elif cycle_list_type == CycleListType.VELOCITY:
+            velocity = int(note_value)
+            assert velocity >= 0 and velocity <= 9
+            note.velocity = int((velocity / 9) * 127)
+        elif cycle_list_type == CycleListType.GATE_LENGTH:
+            # fraction of the note's allotted time that it actually sounds
+            note.width = Decimal(note_value)
+            assert note.width > 0 and note.width <= 1
+        elif cycle_list_type == CycleListType.NUDGE:
+            # fraction of the note's allotted time to delay its start by
+            note.offset = Decimal(note_value)
+            assert note.offset >= 0 and note.offset < 1
+        voices[i].append(note)
+
+
+def generate_level(
+    tree: TreeNode,
+    start: Fraction,
+    end: Fraction,
+    cycle_list_type: CycleListType,
+    voices: list[Voice],
+    memo: VoiceMemo,
+    shared: set[int],
+) -> list[Fraction]:
+    """
+    In-order traversal of tree that appends the notes of its leaves, spread over
+    [start, end), to voices.  Shared subtrees are generated once (in [0, 1)) and then
+    scaled and offset into place, the rest are generated straight into voices.  Returns
+    the leading ties: for each voice, how much a tie before its first note in tree
+    extends the note before tree.
+
+    The levels being generated are kept on a stack rather than recursing so there's no
+    limit on how deeply cycles can be nested.
+    """
+    root = subtree_level(tree, start, end - start, voices)
+    levels = [root]
+    while levels:
+        level = levels[-1]
+        if level.next_child == len(level.children):
+            levels.pop()
+            if levels:
+                finish_level(level, levels[-1], memo)
+            continue
+
+        # all time ranges are start-inclusive and end-exclusive.
+        child = level.children[level.next_child]
+        child_start = level.start + level.next_child * level.increment
+        level.next_child += 1
+
+        if not isinstance(child, TreeNode):
+            child_end = child_start + level.increment
+            add_leaf(level, child, child_start, child_end, cycle_list_type)
+        elif id(child) in memo:
+            place_shared(level, memo[id(child)], child_start)
+        elif id(child) in shared:
+            child_level = subtree_level(child, Fraction(0), Fraction(1), [], id(child))
+            child_level.place_start = child_start
+            levels.append(child_level)
+        else:
+            levels.append(
+                subtree_level(child, child_start, level.increment, level.voices)
+            )
+
+    return root.leading_ties
+
+
 def generate_voices(
     tree: TreeNode,
     start: Fraction,
@@ -232,152 +610,588 @@ def generate_voices(
     """
     In-order traversal of tree, generating a Note object for every
     leaf node with start and end set based on the provided start, end, and the number of
-    child nodes.
+    child nodes.  Ties before the first note of a voice extend the last note of that
+    voice in parent_voices.
 
+    Every level of the tree appends straight to the same voices (only the notes of
+    shared subtrees are copied into place) so nothing is concatenated or re-copied.
     """
     voices: list[Voice] = [[]]
-    child_count = len(tree.children)
-    increment = Fraction((end - start) / child_count)
-
-    for i, child in enumerate(tree.children):
-        # all time ranges are start-inclusive and end-exclusive.
-        child_start = start + (i * increment)
-        child_end = start + ((i + 1) * increment)
-
-        if isinstance(child, TreeNode):
-            child_voices = generate_voices(
-                child, child_start, child_end, cycle_list_type, voices
-            )
-            voices = extend_voices(voices, child_voices)
-        else:
-            # TODO add support for setting width, offset
-            note_values = child.split(",")
-            missing_voice_count = len(note_values) - len(voices)
-            if missing_voice_count > 0:
-                for i in range(missing_voice_count):
-                    voices.append([])
-            for i, note_value in enumerate(note_values):
-                note = Note(child_start, child_end)
-                if cycle_list_type == CycleListType.NOTES:
-                    if note_value == TIE_LITERAL:
-                        # for ties we figure out what the previous note was
-                        # in this voice and update its end, then continue
-                        if len(voices[i]) > 0:
-                            voices[i][-1].end += child_end - child_start
-                        else:
-                            assert len(parent_voices) > i and len(parent_voices[i])
-                            parent_voices[i][-1].end += child_end - child_start
-                        continue
-                    else:
-                        note.pitch = note_value
-                elif cycle_list_type == CycleListType.RHYTHM:
-                    # special case for rests in RHYTHM cycles
-                    if note_value == REST_LITERAL:
-                        note.pitch = note_value
-                elif cycle_list_type == CycleListType.VELOCITY:
-                    velocity = int(note_value)
-                    assert velocity >= 0 and velocity <= 9
-                    note.velocity = int((velocity / 9) * 127)
-                voices[i].append(note)
+    leading_ties = generate_level(
+        tree, start, end, cycle_list_type, voices, {}, shared_subtrees(tree)
+    )
+    for i, tie in enumerate(leading_ties):
+        if tie:
+            assert len(parent_voices) > i and len(parent_voices[i])
+            parent_voices[i][-1].end += tie
 
     return voices
 
 
-def merge_note(
+def merge_fields(
     left_note: Note, right_note: Note, cycle_list_type: CycleListType
-) -> Note:
-    # TODO add other cycle list types
+) -> dict[str, Any]:
+    """
+    Returns the fields that right_note (from a lane of the given type) contributes to
+    left_note.
+    """
     if cycle_list_type == CycleListType.VELOCITY:
         assert left_note.velocity is None
-        return replace(left_note, velocity=right_note.velocity)
+        return {"velocity": right_note.velocity}
     elif cycle_list_type == CycleListType.NOTES:
         # special case for rests in RHYTHM cycles
         if left_note.pitch == REST_LITERAL:
-            return left_note
+            return {}
         assert left_note.pitch == ""
-        return replace(left_note, pitch=right_note.pitch)
+        return {"pitch": right_note.pitch}
+    elif cycle_list_type == CycleListType.GATE_LENGTH:
+        assert left_note.width is None
+        return {"width": right_note.width}
+    elif cycle_list_type == CycleListType.NUDGE:
+        assert left_note.offset is None
+        return {"offset": right_note.offset}
 
     raise Exception(f"Unexpected cycle list type: {cycle_list_type}")
 
 
-def merge_voice(
-    left_voice: Voice, right_voice: Voice, cycle_list_type: CycleListType
-) -> Voice:
-    # we should only get here if there's something to merge into
-    assert len(left_voice) > 0
+def repeat_voice(
+    voice: Voice, voice_length: int, desired_voice_length: int
+) -> Iterator[tuple[Note, int]]:
+    """
+    Lazily walks a voice repeated out to desired_voice_length cycles, yielding each
+    note along with the offset (in cycles) it should be shifted by.  Nothing is copied.
+    """
+    for offset in range(0, desired_voice_length, voice_length):
+        for note in voice:
+            yield (note, offset)
+
+
+def merge_lanes(lanes: list[tuple[CycleListType, list[Voice]]]) -> list[Voice]:
+    """
+    Merges all of a stack's lanes in a single sweep.  The first lane provides the
+    notes (and therefore the rhythm); every other lane is walked in parallel with it
+    and contributes its values to each note whose start it spans.  Notes that no
+    right-hand note spans are dropped.
+
+    All lanes are repeated out to a common length (the LCM of their voice lengths)
+    as they're walked rather than by copying.  The merged notes are always new ones,
+    never the lanes' own, since those are parse_cycles' cached notes.
+    """
+    (_, base_voices) = lanes[0]
+    if len(lanes) == 1:
+        return [
+            [
+                Note(
+                    note.start,
+                    note.end,
+                    note.pitch,
+                    note.velocity,
+                    note.width,
+                    note.offset,
+                )
+                for note in voice
+            ]
+            for voice in base_voices
+        ]
 
     # merging rhythm into anything else is not supported, it must come first
-    assert cycle_list_type != CycleListType.RHYTHM
-
-    right_i = 0
-    left_i = 0
-    new_voice = []
-    while right_i < len(right_voice) and left_i < len(left_voice):
-        right_note = right_voice[right_i]
-        left_note = left_voice[left_i]
-
-        # right starts after left starts: no merge, inc. left
-        if right_note.start > left_note.start:
-            left_i += 1
-        # right ends before (or at) left start: no merge, inc. right
-        elif right_note.end <= left_note.start:
-            right_i += 1
-        # right spans left start: merge
+    assert all(
+        cycle_list_type != CycleListType.RHYTHM for cycle_list_type, _ in lanes[1:]
+    )
+    # we don't support polyphony mismatches between lanes
+    assert all(len(voices) == len(base_voices) for _, voices in lanes)
+
+    all_voices = [voice for _, voices in lanes for voice in voices]
+    desired_voice_length = calc_desired_voice_length(all_voices)
+    lane_voice_lengths = [calc_voice_lengths(voices) for _, voices in lanes]
+
+    merged_voices = []
+    for i, base_voice in enumerate(base_voices):
+        cursors = [
+            repeat_voice(voices[i], voice_lengths[i], desired_voice_length)
+            for (_, voices), voice_lengths in zip(lanes, lane_voice_lengths)
+        ]
+        # the heads hold the right-hand note each cursor currently points at
+        heads: list[Optional[tuple[Note, int]]] = [
+            next(cursor, None) for cursor in cursors[1:]
+        ]
+        merged_voice = []
+        for left_note, left_offset in cursors[0]:
+            left_start = left_note.start + left_offset
+            fields: dict[str, Any] = {}
+            for j, (cycle_list_type, _) in enumerate(lanes[1:]):
+                # skip right-hand notes that end before (or at) left start
+                head = heads[j]
+                while head is not None and head[0].end + head[1] <= left_start:
+                    head = next(cursors[j + 1], None)
+                heads[j] = head
+
+                # right starts after left starts (or there is no right): no merge
+                if head is None or head[0].start + head[1] > left_start:
+                    break
+                fields.update(merge_fields(left_note, head[0], cycle_list_type))
+            else:
+                merged_voice.append(
+                    replace(
+                        left_note,
+                        start=left_start,
+                        end=left_note.end + left_offset,
+                        **fields,
+                    )
+                )
+        merged_voices.append(merged_voice)
+
+    return merged_voices
+
+
+ChunkJob = tuple[Sequence[Union[TreeNode, str, Repeat]], int, CycleListType, int]
+
+
+def chunk_jobs(
+    cycle_tree: TreeNode,
+    cycle_list_type: CycleListType,
+    chunk_count: int,
+    seed_count: int,
+) -> list[ChunkJob]:
+    """
+    Splits the top level cycles into chunk_count runs of consecutive cycles that can be
+    generated independently.  Each job is (cycles, index of the first cycle, cycle list
+    type, number of voices to seed).  The first chunk isn't seeded since there's nothing
+    before it for a tie to extend.
+    """
+    cycles = expand_repeats(cycle_tree.children)
+    cycle_count = len(cycles)
+    bounds = [i * cycle_count // chunk_count for i in range(chunk_count + 1)]
+    return [
+        (cycles[start:end], start, cycle_list_type, seed_count if i else 0)
+        for i, (start, end) in enumerate(zip(bounds, bounds[1:]))
+        if start < end
+    ]
+
+
+def generate_chunk(job: ChunkJob) -> tuple[list[Fraction], list[Voice]]:
+    """
+    Generates the voices of a run of top level cycles as if they were part of the whole
+    cycle list.  Returns the leading ties of the first seed_count voices (i.e. how much
+    to extend the last note of the previous chunk by, see generate_level) and the
+    voices.
+    """
+    (cycles, start, cycle_list_type, seed_count) = job
+    chunk_tree = TreeNode(list(cycles))
+    voices: list[Voice] = [[]]
+    ties = generate_level(
+        chunk_tree,
+        Fraction(start),
+        Fraction(start + len(cycles)),
+        cycle_list_type,
+        voices,
+        {},
+        shared_subtrees(chunk_tree),
+    )
+    # ties in unseeded voices have nothing to extend
+    assert not any(ties[seed_count:])
+    ties = ties[:seed_count] + [Fraction(0)] * (seed_count - len(ties))
+    # voices that are nothing but ties are empty
+    while voices and not voices[-1]:
+        voices.pop()
+
+    return (ties, voices)
+
+
+def stitch_chunks(chunks: list[tuple[list[Fraction], list[Voice]]]) -> list[Voice]:
+    """
+    Joins the output of generate_chunk back together in order, applying each chunk's
+    leading ties to the last note so far in the corresponding voice.
+    """
+    voices: list[Voice] = []
+    for ties, chunk_voices in chunks:
+        for i, tie in enumerate(ties):
+            if tie:
+                assert len(voices) > i and len(voices[i])
+                voices[i][-1].end += tie
+        for i, voice in enumerate(chunk_voices):
+            if i == len(voices):
+                voices.append([])
+            voices[i].extend(voice)
+
+    return voices
+
+
+def max_voice_count(cycle_list: str) -> int:
+    """
+    Upper bound on the number of voices a cycle list can generate.
+    """
+    return max((token.count(",") for token in cycle_list.split()), default=0) + 1
+
+
+# parses and cost estimates are cached (so re-running a song that only changed one
+# lane, e.g. in watch mode, only re-parses and re-estimates that lane) so the voices
+# returned must never be modified
+PARSE_CACHE_SIZE = 256
+
+
+###
+# Cost estimates: a typo (e.g. lanes with coprime lengths, or one more < > group) can
+# make a song expand to billions of notes, so Cycles.midi() first predicts how big the
+# song will be from the cycle lists alone and fails before materializing anything if
+# it's over the limits in Config.
+###
+
+
+@dataclass
+class AlternativeGroup:
+    # lengths of the elements so far, and of the current one
+    element_lengths: list[Fraction] = field(default_factory=list)
+    length: Fraction = Fraction(0)
+    # the longest element so far, and the current one
+    longest: str = ""
+    text: list[str] = field(default_factory=list)
+
+    def end_element(self) -> None:
+        self.element_lengths.append(self.length)
+        element = "".join(self.text)
+        if len(element) > len(self.longest):
+            self.longest = element
+        self.length = Fraction(0)
+        self.text = []
+
+
+def analyze_alternatives(cycle_list: str) -> tuple[int, int, str]:
+    """
+    Works out what expand_alternatives would do to cycle_list without doing it: returns
+    how many copies of the cycle list it would make, how long its result would be and a
+    single representative copy, with each alternative replaced by its longest element.
+    """
+    copies = 1
+    # the cycle list itself and then any open alternatives, innermost last
+    groups = [AlternativeGroup()]
+    for c in cycle_list:
+        group = groups[-1]
+        if c == "<":
+            groups.append(AlternativeGroup())
+        elif c == ">" and len(groups) > 1:
+            group.end_element()
+            groups.pop()
+            copies_of_group = len(group.element_lengths)
+            copies *= copies_of_group
+            # each copy has one element, on average one of average length
+            groups[-1].length += Fraction(sum(group.element_lengths), copies_of_group)
+            groups[-1].text.append(group.longest)
+        elif c == " " and len(groups) > 1:
+            group.end_element()
+        else:
+            group.length += 1
+            group.text.append(c)
+
+    # alternatives that are never closed aren't expanded
+    while len(groups) > 1:
+        group = groups.pop()
+        groups[-1].length += 1 + sum(group.element_lengths) + group.length
+        groups[-1].length += len(group.element_lengths)
+        groups[-1].text.append("<" + group.longest + "".join(group.text))
+
+    # the copies are joined with spaces
+    length = ceil(copies * groups[0].length) + copies - 1
+    return (copies, length, "".join(groups[0].text))
+
+
+@dataclass
+class LaneCost:
+    # index of the lane in Cycles.cycle_lists
+    lane: int
+    cycle_list_type: CycleListType
+    cycle_list: str
+    # length of the cycle list once its alternatives are expanded
+    expanded_chars: int
+    voice_count: int
+    cycle_count: int
+    # notes generated for the lane (before it's repeated out to the song's length)
+    note_count: int
+
+    def describe(self) -> str:
+        cycle_list = " ".join(self.cycle_list.split())
+        if len(cycle_list) > 40:
+            cycle_list = cycle_list[:37] + "..."
+        return f"lane {self.lane} ({self.cycle_list_type.name.lower()} {cycle_list!r})"
+
+
+def estimate_lane_cost(
+    lane: int, cycle_list_type: CycleListType, cycle_list: str
+) -> LaneCost:
+    return LaneCost(lane, cycle_list_type, cycle_list, *estimate_lane_size(cycle_list))
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def estimate_lane_size(cycle_list: str) -> tuple[int, int, int, int]:
+    """
+    Predicts the size of a lane from one representative copy (see analyze_alternatives)
+    of its cycle list.  Repeats are counted, not expanded.  Counts err on the high side
+    (every alternative is assumed to be its longest element and every leaf value a
+    note) except that every voice is assumed to last as long as the lane.  Returns the
+    expanded_chars, voice_count, cycle_count and note_count of a LaneCost.
+    """
+    (copies, expanded_chars, representative) = analyze_alternatives(cycle_list)
+    tree = build_cycle_tree(split_cycles(representative))
+    # notes below each distinct subtree
+    note_counts: dict[int, int] = {}
+    for node in distinct_subtrees(tree):
+        note_counts[id(node)] = sum(
+            count
+            * (
+                note_counts[id(child)]
+                if isinstance(child, TreeNode)
+                else len(child.split(","))
+            )
+            for child, count in repeated_children(node)
+        )
+    cycle_count = sum(count for _, count in repeated_children(tree))
+
+    return (
+        expanded_chars,
+        max_voice_count(cycle_list.replace("<", "").replace(">", "")),
+        copies * cycle_count,
+        copies * note_counts[id(tree)],
+    )
+
+
+@dataclass
+class CostEstimate:
+    lanes: list[LaneCost]
+    # the lanes of each stack
+    stacks: list[list[LaneCost]]
+    # every voice is repeated out to the LCM of all the lanes' lengths
+    cycle_count: int
+    voice_count: int
+    # notes in the finished song
+    note_count: int
+
+    def check(self, config: Config) -> None:
+        """
+        Raises an exception naming the lane responsible if the song would go over any
+        of config's limits.
+        """
+        if config.max_expanded_chars is not None:
+            for lane in self.lanes:
+                if lane.expanded_chars > config.max_expanded_chars:
+                    raise Exception(
+                        f"{lane.describe()} would expand to {lane.expanded_chars:,}"
+                        f" characters, more than max_expanded_chars"
+                        f" ({config.max_expanded_chars:,}): check its < > alternatives"
+                    )
+
+        if config.max_cycles is not None:
+            cycle_count = 1
+            for lane in self.lanes:
+                cycle_count = lcm(cycle_count, lane.cycle_count)
+                if cycle_count > config.max_cycles:
+                    raise Exception(
+                        f"{lane.describe()} is {lane.cycle_count:,} cycles long, which"
+                        f" makes the song (the LCM of the lanes' lengths so far)"
+                        f" {cycle_count:,} cycles, more than max_cycles"
+                        f" ({config.max_cycles:,})"
+                    )
+
+        if config.max_voices is not None and self.voice_count > config.max_voices:
+            lane = max(self.lanes, key=lambda lane: lane.voice_count)
+            raise Exception(
+                f"The song would have {self.voice_count} voices, more than max_voices"
+                f" ({config.max_voices}): {lane.describe()} has {lane.voice_count}"
+            )
+
+        if config.max_notes is not None:
+            for lane in self.lanes:
+                if lane.note_count > config.max_notes:
+                    raise Exception(
+                        f"{lane.describe()} would generate {lane.note_count:,} notes,"
+                        f" more than max_notes ({config.max_notes:,})"
+                    )
+            if self.note_count > config.max_notes:
+                lane = max(
+                    (lanes[0] for lanes in self.stacks),
+                    key=lambda lane: self.repeated_note_count(lane),
+                )
+                raise Exception(
+                    f"The song would have {self.note_count:,} notes, more than"
+                    f" max_notes ({config.max_notes:,}): {lane.describe()} has"
+                    f" {self.repeated_note_count(lane):,} once it's repeated out to"
+                    f" {self.cycle_count:,} cycles"
+                )
+
+    def repeated_note_count(self, lane: LaneCost) -> int:
+        if not lane.cycle_count:
+            return 0
+        return lane.note_count * (self.cycle_count // lane.cycle_count)
+
+
+def estimate_cost(cycle_lists: list[CycleList]) -> CostEstimate:
+    lanes = []
+    stacks: list[list[LaneCost]] = [[]]
+    for i, (cycle_list_type, cycle_list) in enumerate(cycle_lists):
+        if cycle_list_type == CycleListType.STACK:
+            stacks.append([])
         else:
-            new_note = merge_note(left_note, right_note, cycle_list_type)
-            new_voice.append(new_note)
+            lane = estimate_lane_cost(i, cycle_list_type, cycle_list)
+            lanes.append(lane)
+            stacks[-1].append(lane)
+    stacks = [lanes for lanes in stacks if lanes]
+
+    estimate = CostEstimate(
+        lanes,
+        stacks,
+        lcm(*(lane.cycle_count for lane in lanes)),
+        sum(max(lane.voice_count for lane in lanes) for lanes in stacks),
+        0,
+    )
+    # only the first lane of a stack provides notes, the rest provide values for them
+    estimate.note_count = sum(
+        estimate.repeated_note_count(lanes[0]) for lanes in stacks
+    )
+    return estimate
 
-            # always increment left here because we've merged into it
-            left_i += 1
 
-    return new_voice
+class ParseCache:
+    """
+    The most recently parsed lanes, like functools.lru_cache except that lanes parsed
+    somewhere else (e.g. in worker processes, see parse_lanes) can be put in.  The
+    voices are shared with every caller so they must never be modified.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.lanes: OrderedDict[CycleList, tuple[list[Voice], int]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, lane: CycleList) -> Optional[tuple[list[Voice], int]]:
+        parsed = self.lanes.get(lane)
+        if parsed is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.lanes.move_to_end(lane)
+        return parsed
+
+    def put(self, lane: CycleList, parsed: tuple[list[Voice], int]) -> None:
+        self.lanes[lane] = parsed
+        self.lanes.move_to_end(lane)
+        if len(self.lanes) > self.maxsize:
+            self.lanes.popitem(last=False)
+
+    def clear(self) -> None:
+        self.lanes.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+parse_cache = ParseCache(PARSE_CACHE_SIZE)
 
 
 def parse_cycles(
-    cycle_list: str, cycle_list_type: CycleListType
+    cycle_list: str, cycle_list_type: CycleListType, workers: int = 1
 ) -> tuple[list[Voice], int]:
+    """
+    Like generate_lane but cached.  workers isn't part of the key since it doesn't
+    change the result.
+    """
+    lane = (cycle_list_type, cycle_list)
+    parsed = parse_cache.get(lane)
+    if parsed is None:
+        parsed = generate_lane(cycle_list, cycle_list_type, workers)
+        parse_cache.put(lane, parsed)
+    return parsed
+
+
+def generate_lane(
+    cycle_list: str, cycle_list_type: CycleListType, workers: int = 1
+) -> tuple[list[Voice], int]:
+    """
+    If workers > 1 the top level cycles are split into chunks whose voices are generated
+    in parallel across a pool of worker processes and then stitched back together.
+    """
     expanded = expand_alternatives(cycle_list)
     cycles = split_cycles(expanded)
     cycle_tree = build_cycle_tree(cycles)
-    cycle_count = len(cycle_tree.children)
-    voices = generate_voices(
-        cycle_tree, Fraction(0), Fraction(cycle_count), cycle_list_type, [[]]
-    )
+    cycle_count = len(expand_repeats(cycle_tree.children))
+    if workers > 1 and cycle_count > 1:
+        jobs = chunk_jobs(
+            cycle_tree,
+            cycle_list_type,
+            min(workers, cycle_count),
+            max_voice_count(expanded),
+        )
+        with process_pool(workers) as executor:
+            voices = stitch_chunks(list(executor.map(generate_chunk, jobs)))
+    else:
+        voices = generate_voices(
+            cycle_tree, Fraction(0), Fraction(cycle_count), cycle_list_type, [[]]
+        )
 
     return (voices, cycle_count)
 
 
-def parse_cycle_lists(cycle_lists: list[CycleList]) -> tuple[list[Voice], int]:
-    voices: list[Voice] = [[]]
-    base_voice_idx = 0
-    max_cycle_count = 0
+def split_stacks(
+    cycle_lists: list[CycleList],
+) -> list[list[CycleList]]:
+    """
+    Groups the cycle lists into stacks, each of which is a list of lanes that will be
+    merged together into one group of voices.
+    """
+    stacks: list[list[CycleList]] = [[]]
     for cycle_list_type, cycle_list in cycle_lists:
         if cycle_list_type == CycleListType.STACK:
-            voices.append([])
-            base_voice_idx = len(voices) - 1
+            stacks.append([])
         else:
-            (new_voices, cycle_count) = parse_cycles(cycle_list, cycle_list_type)
-            existing_voices = voices[base_voice_idx:]
-            if existing_voices == [[]]:  # nothing to merge into
-                voices[base_voice_idx:] = new_voices
-            else:
-                (existing_voices, new_voices) = normalize_voice_counts(
-                    existing_voices, new_voices
-                )
-                assert len(existing_voices) == len(new_voices)
-                desired_voice_length = calc_desired_voice_length(
-                    existing_voices + new_voices
-                )
-                existing_voices = normalize_voice_length(
-                    existing_voices, desired_voice_length
-                )
-                new_voices = normalize_voice_length(new_voices, desired_voice_length)
-                merged_voices = [
-                    merge_voice(existing_voices[i], new_voices[i], cycle_list_type)
-                    for i in range(len(new_voices))
-                ]
-                voices[base_voice_idx:] = merged_voices
+            stacks[-1].append((cycle_list_type, cycle_list))
+
+    return [lanes for lanes in stacks if lanes]
+
+
+def parse_lane(lane: CycleList, workers: int = 1) -> tuple[list[Voice], int]:
+    (cycle_list_type, cycle_list) = lane
+    return generate_lane(cycle_list, cycle_list_type, workers)
+
+
+def parse_lanes(lanes: list[CycleList], workers: int) -> list[tuple[list[Voice], int]]:
+    """
+    Parses every lane that isn't cached, in parallel across a pool of worker processes
+    if workers > 1.  Lanes don't depend on each other until they're merged so the
+    results are the same either way.  When there are fewer lanes to parse than workers
+    each lane is split into chunks instead (see generate_lane) so that a few long lanes
+    still use every worker.  The lanes parsed in worker processes are put into the
+    cache here since the workers' own caches are thrown away with them.
+    """
+    # each distinct lane is looked up (and parsed) once
+    distinct = list(dict.fromkeys(lanes))
+    cached = [parse_cache.get(lane) for lane in distinct]
+    parsed = {lane: hit for lane, hit in zip(distinct, cached) if hit is not None}
+    missing = [lane for lane, hit in zip(distinct, cached) if hit is None]
+    if workers > 1 and len(missing) >= workers:
+        with process_pool(workers) as executor:
+            missing_parsed = list(executor.map(parse_lane, missing))
+    else:
+        missing_parsed = [parse_lane(lane, workers) for lane in missing]
+    for lane, lane_parsed in zip(missing, missing_parsed):
+        parse_cache.put(lane, lane_parsed)
+        parsed[lane] = lane_parsed
+
+    return [parsed[lane] for lane in lanes]
+
+
+def parse_cycle_lists(
+    cycle_lists: list[CycleList], workers: int = 1
+) -> tuple[list[Voice], int]:
+    stacks = split_stacks(cycle_lists)
+    parsed = iter(parse_lanes([lane for lanes in stacks for lane in lanes], workers))
+
+    voices: list[Voice] = []
+    max_cycle_count = 0
+    for lanes in stacks:
+        parsed_lanes = []
+        for cycle_list_type, _ in lanes:
+            (lane_voices, cycle_count) = next(parsed)
+            parsed_lanes.append((cycle_list_type, lane_voices))
             max_cycle_count = max(cycle_count, max_cycle_count)
+        voices.extend(merge_lanes(parsed_lanes))
 
     desired_voice_length = calc_desired_voice_length(voices)
     voices = normalize_voice_length(voices, desired_voice_length)
@@ -385,79 +1199,172 @@ def parse_cycle_lists(cycle_lists: list[CycleList]) -> tuple[list[Voice], int]:
     return (voices, max_cycle_count)
 
 
-def generate_midi(
-    voices: list[Voice], config: Config, cycle_count: int
-) -> tuple[MidiFile, int]:
-    mid = MidiFile()
-    channel = 0
+def ticks_per_cycle(config: Config, ticks_per_beat: int) -> int:
+    return ticks_per_beat * config.beats_per_measure
 
-    ticks_per_cycle = mid.ticks_per_beat * config.beats_per_measure
-    tempo = bpm2tempo(config.beats_per_minute)
 
-    for voice in voices:
-        track = MidiTrack()
-        track.append(MetaMessage("set_tempo", tempo=tempo))
+def note_timing(note: Note, config: Config) -> tuple[Fraction, Any]:
+    """
+    Returns when (in cycles) the note actually starts sounding and for how long, taking
+    width (the note's own or the configured one) and offset into account.
+    """
+    width = config.note_width if note.width is None else Fraction(note.width)
+    # index of start's cycle
+    start_cycle = floor(note.start)
+    end_floor = floor(note.end)
+    # index of end's cycle (note times, start->end, is endpoint exclusive)
+    end_cycle = end_floor - 1 if end_floor == note.end else end_floor
+    if start_cycle != end_cycle:
+        # when a note spans multiple cycles we calculate the "width" of the note
+        # based on the length of the portion in the final cycle
+        note_duration = (end_floor - note.start) + ((note.end - end_floor) * width)
+    else:
+        note_duration = (note.end - note.start) * width
 
-        # it's important to remember here that note.start and note.end are
-        # absolute values from the beginning of the track, measured in
-        # number of cycles but the Message.time values are relative to
-        # time of the previous message
+    note_on = note.start
+    if note.offset is not None:
+        # nudged notes still have to stop by the end of their allotted time
+        note_on += (note.end - note.start) * Fraction(note.offset)
+        note_duration = min(note_duration, note.end - note_on)
+
+    return (note_on, note_duration)
 
-        prev_note_end: float = 0  # contains _absolute_ time of prev note's note_off
-        for note in voice:
-            # don't update prev_note_end or append Messages for rest events
-            if note.pitch != REST_LITERAL:
-                # index of start's cycle
-                start_cycle = floor(note.start)
-                end_floor = floor(note.end)
-                # index of end's cycle (note times, start->end, is endpoint exclusive)
-                end_cycle = end_floor - 1 if end_floor == note.end else end_floor
-                if start_cycle != end_cycle:
-                    # when a note spans multiple cycles we calculate the "width" of the note
-                    # based on the length of the portion in the final cycle
-                    note_duration = (end_floor - note.start) + (
-                        (note.end - end_floor) * config.note_width
-                    )
-                else:
-                    note_duration = (note.end - note.start) * config.note_width
-
-                midi_note, velocity = get_midi_note_and_velocity(note.pitch)
-                if note.velocity is not None:
-                    velocity = note.velocity
-                track.append(
-                    Message(
-                        "note_on",
-                        channel=channel,
-                        note=midi_note,
-                        velocity=velocity,
-                        # delta from preceding note_off (or start of song)
-                        time=round((note.start - prev_note_end) * ticks_per_cycle),
-                    )
-                )
-                track.append(
-                    Message(
-                        "note_off",
-                        channel=channel,
-                        note=midi_note,
-                        velocity=velocity,
-                        # delta from preceding note_on
-                        time=round(note_duration * ticks_per_cycle),
-                    )
-                )
-                prev_note_end = note.start + note_duration
 
+def new_track(config: Config) -> MidiTrack:
+    track = MidiTrack()
+    track.append(MetaMessage("set_tempo", tempo=bpm2tempo(config.beats_per_minute)))
+    return track
+
+
+def append_note(
+    track: MidiTrack,
+    note: Note,
+    channel: int,
+    prev_note_end: Any,
+    config: Config,
+    cycle_ticks: int,
+) -> Any:
+    """
+    Appends the note's messages to the track and returns the new prev_note_end.
+
+    It's important to remember here that note.start and note.end are absolute values
+    from the beginning of the track, measured in number of cycles but the Message.time
+    values are relative to time of the previous message.  prev_note_end is the
+    _absolute_ time of the previous note's note_off.
+    """
+    # don't update prev_note_end or append Messages for rest events
+    if note.pitch == REST_LITERAL:
+        return prev_note_end
+
+    midi_note, velocity = get_midi_note_and_velocity(note.pitch)
+    if note.velocity is not None:
+        velocity = note.velocity
+
+    ticks = full_width_ticks(note, prev_note_end, cycle_ticks)
+    if ticks is not None:
+        (on_delta, duration) = ticks
+        note_end = note.end
+    else:
+        (note_on, note_duration) = note_timing(note, config)
+        # delta from preceding note_off (or start of song)
+        on_delta = round((note_on - prev_note_end) * cycle_ticks)
+        duration = round(note_duration * cycle_ticks)
+        note_end = note_on + note_duration
+
+    track.append(
+        Message(
+            "note_on",
+            channel=channel,
+            note=midi_note,
+            velocity=velocity,
+            time=on_delta,
+        )
+    )
+    track.append(
+        Message(
+            "note_off",
+            # same values as the note_on, which has just checked them
+            skip_checks=True,
+            channel=channel,
+            note=midi_note,
+            velocity=velocity,
+            # delta from preceding note_on
+            time=duration,
+        )
+    )
+    return note_end
+
+
+def full_width_ticks(
+    note: Note, prev_note_end: Any, cycle_ticks: int
+) -> Optional[tuple[int, int]]:
+    """
+    Fast path for notes that sound for all of their time (e.g. the ASCII front end's,
+    whose symbol timings are already whole ticks): returns the note_on delta and the
+    duration in ticks using integer arithmetic, or None if the note (or the end of the
+    previous one) isn't a whole number of ticks and needs note_timing.
+    """
+    if note.offset is not None or note.width != 1:
+        return None
+    try:
+        (prev_den, on_den, off_den) = (
+            prev_note_end.denominator,
+            note.start.denominator,
+            note.end.denominator,
+        )
+    except AttributeError:  # floats
+        return None
+    if cycle_ticks % prev_den or cycle_ticks % on_den or cycle_ticks % off_den:
+        return None
+    prev_tick = prev_note_end.numerator * (cycle_ticks // prev_den)
+    on_tick = note.start.numerator * (cycle_ticks // on_den)
+    off_tick = note.end.numerator * (cycle_ticks // off_den)
+    return (on_tick - prev_tick, off_tick - on_tick)
+
+
+def build_midi_file(voices: Sequence[Iterable[Note]], config: Config) -> MidiFile:
+    """
+    Turns voices into a MidiFile with one track (and channel) per voice.  This is the
+    single MIDI emitter: every front end (cycles, ASCII) compiles into voices and ends up
+    here.  The voices can be any iterables of notes in time order, e.g. generators that
+    move notes into place as they go.
+    """
+    mid = MidiFile()
+    cycle_ticks = ticks_per_cycle(config, mid.ticks_per_beat)
+
+    for channel, voice in enumerate(voices):
+        track = new_track(config)
+        prev_note_end: Any = 0
+        for note in voice:
+            prev_note_end = append_note(
+                track, note, channel, prev_note_end, config, cycle_ticks
+            )
         mid.tracks.append(track)
-        channel += 1
 
+    return mid
+
+
+def generate_midi(
+    voices: Sequence[Iterable[Note]], config: Config, cycle_count: int
+) -> tuple[MidiFile, int]:
+    mid = build_midi_file(voices, config)
     mid.save(config.midi_file_name)
-    total_secs = tick2second(cycle_count * ticks_per_cycle, mid.ticks_per_beat, tempo)
 
-    return (mid, total_secs)
+    return (mid, song_secs(cycle_count, config, mid.ticks_per_beat))
+
+
+def song_secs(cycle_count: int, config: Config, ticks_per_beat: int) -> Any:
+    return tick2second(
+        cycle_count * ticks_per_cycle(config, ticks_per_beat),
+        ticks_per_beat,
+        bpm2tempo(config.beats_per_minute),
+    )
 
 
 class Cycles:
     def __init__(self) -> None:
         self.cycle_lists: list[CycleList] = []
+        self.voices: list[Voice] = []
         self.midi_file: Optional[MidiFile] = None
         self.total_secs: int = 0
         self.config: Config = Config()
@@ -476,13 +1383,11 @@ class Cycles:
         return self
 
     def gate_length(self, cycle_list: str) -> Cycles:
-        # TODO: implement
-        # self.cycle_lists.append((CycleListType.GATE_LENGTH, cycle_list))
+        self.cycle_lists.append((CycleListType.GATE_LENGTH, cycle_list))
         return self
 
     def nudge(self, cycle_list: str) -> Cycles:
-        # TODO: implement
-        # self.cycle_lists.append((CycleListType.NUDGE, cycle_list))
+        self.cycle_lists.append((CycleListType.NUDGE, cycle_list))
         return self
 
     def stack(self) -> Cycles:
@@ -493,12 +1398,86 @@ class Cycles:
         setattr(self.config, param, val)
         return self
 
+    def estimate_cost(self) -> CostEstimate:
+        """
+        Predicts how big the song will be (see CostEstimate) without compiling it.
+        """
+        return estimate_cost(self.cycle_lists)
+
     def midi(self) -> Cycles:
-        (voices, cycle_count) = parse_cycle_lists(self.cycle_lists)
+        self.estimate_cost().check(self.config)
+        (self.voices, cycle_count) = parse_cycle_lists(
+            self.cycle_lists, self.config.compile_workers
+        )
         (self.midi_file, self.total_secs) = generate_midi(
-            voices, self.config, cycle_count
+            self.voices, self.config, cycle_count
+        )
+
+        return self
+
+    def sharing_stats(self) -> SharingStats:
+        """
+        How many subtrees (e.g. bars) all the lanes have and how many of them are
+        different, i.e. how many actually have voices generated for them.
+        """
+        stats = SharingStats()
+        for cycle_list_type, cycle_list in self.cycle_lists:
+            if cycle_list_type != CycleListType.STACK:
+                cycles = split_cycles(expand_alternatives(cycle_list))
+                lane_stats = sharing_stats(build_cycle_tree(cycles))
+                stats.subtrees += lane_stats.subtrees
+                stats.distinct_subtrees += lane_stats.distinct_subtrees
+        return stats
+
+    def bandwidth_report(self, window_ms: float = 1.0) -> BandwidthReport:
+        """
+        Analyzes what play() would send (notes plus clock) against the configured
+        bandwidth_limit (or the DIN MIDI rate if there is none).  Call midi() first.
+        """
+        assert self.midi_file is not None
+        messages = add_clock_messages(
+            list(self.midi_file), self.config.beats_per_minute, 24
+        )
+        seconds_per_cycle = (
+            self.config.beats_per_measure * 60 / self.config.beats_per_minute
+        )
+        return analyze_bandwidth(
+            messages,
+            self.config.midi_devices or [],
+            seconds_per_cycle,
+            self.config.bandwidth_limit or DIN_BYTES_PER_SECOND,
+            window_ms,
         )
 
+    def wav(
+        self, waveform: str = "sine", samples: Optional[dict[int, str]] = None
+    ) -> Cycles:
+        """
+        Renders the song to config.wav_file_name with a simple software synth, e.g. to
+        hear it without any MIDI devices, or, if samples (MIDI note number -> WAV file) is
+        given, by playing a sample for each note.  Call midi() first.
+        """
+        # imported here so that numpy is only needed when rendering audio
+        from render import render_wav, render_samples_wav
+
+        assert self.midi_file is not None
+        if samples is not None:
+            render_samples_wav(
+                self.voices,
+                self.config,
+                self.config.wav_file_name,
+                samples,
+                self.total_secs,
+            )
+        else:
+            render_wav(
+                self.voices,
+                self.config,
+                self.config.wav_file_name,
+                self.total_secs,
+                waveform=waveform,
+            )
+
         return self
 
     def play(self) -> Cycles:
@@ -513,3 +1492,10 @@ def notes(cycle_list: str) -> Cycles:
 
 def rhythm(cycle_list: str) -> Cycles:
     return Cycles().rhythm(cycle_list)
+
+
+if __name__ == "__main__":
+    # e.g. `python -m cyclemidi watch song.py`
+    from watch import main
+
+    main(sys.argv[1:])
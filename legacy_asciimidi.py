@@ -0,0 +1,45 @@
+from mido import Message, MidiFile, MidiTrack, MetaMessage, bpm2tempo
+
+from midi import get_midi_note_and_velocity
+
+###
+# Note: only used by the tests and benchmarks, as the reference that asciimidi's output
+# (and speed) is compared to.
+###
+
+def legacy_ascii_to_midi(asciis, config):
+    """
+    The MIDI emitter asciimidi had before it compiled onto the cyclemidi timeline, the
+    reference for test_asciimidi.test_matches_legacy_emitter and for bench_ascii.
+    """
+    def process_symbol(track, channel, symbol, symbol_start, symbol_end, rest_length):
+        if symbol in ('---', '--'):
+            return rest_length + symbol_start + symbol_end
+        if symbol in ('===', '=='):
+            track[-1].time += symbol_start + symbol_end
+        else:
+            midi_note, velocity = get_midi_note_and_velocity(symbol)
+            track.append(Message('note_on', channel=channel, note=midi_note, velocity=velocity, time=rest_length+symbol_start))
+            track.append(Message('note_off', channel=channel, note=midi_note, velocity=velocity, time=symbol_end))
+        return 0
+
+    mid = MidiFile()
+    ticks_per_pair = 2 * (mid.ticks_per_beat // config.symbols_per_beat)
+    left_swing = config.swing * ticks_per_pair
+    right_swing = (1 - config.swing) * ticks_per_pair
+    left_end = right_end = int(config.note_width * right_swing)
+    left_start = int(right_swing - right_end)
+    right_start = int(left_swing - left_end)
+
+    music = '\n'.join([' '.join(z) for z in zip(*[a.split('\n') for a in asciis])])
+    for channel, voice in enumerate(reversed(music.strip().split('\n'))):
+        track = MidiTrack()
+        track.append(MetaMessage('set_tempo', tempo=bpm2tempo(config.beats_per_minute)))
+        symbols = voice.split()
+        rest_length = 0
+        for i, (left, right) in enumerate(zip(symbols[0::2], symbols[1::2])):
+            rest_length = process_symbol(track, channel, left, 0 if i == 0 else left_start, left_end, rest_length)
+            rest_length = process_symbol(track, channel, right, right_start, right_end, rest_length)
+        mid.tracks.append(track)
+
+    return mid
@@ -1,13 +1,21 @@
+from __future__ import annotations  # so that PooledPort can refer to PortPool
+import atexit
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
+from functools import lru_cache
+import multiprocessing
 import re
 import signal
 import sys
+import threading
 import time
-from typing import Any
+from typing import Any, Callable, Optional, Protocol, TextIO
 
 from mido import MidiFile, Message, MetaMessage, Backend  # type: ignore
 from mido.ports import BaseOutput  # type: ignore
 
+from bandwidth import is_note_on, stagger_messages
+
 
 def sigterm_handler(signum: int, frame: Any) -> None:
     raise SystemExit("Program terminated by SIGTERM")
@@ -26,7 +34,43 @@ class Config:
         default_factory=lambda: ["FH-2"]
     )  # Or 'Elektron Model:Cycles' or 'IAC Driver Bus 1'
     midi_file_name: str = "new_song.mid"
+    wav_file_name: str = "new_song.wav"
+    # more than 1 compiles independent lanes (and stacks), or chunks of long lanes, in
+    # parallel worker processes.  They're forked (see process_pool) so song scripts
+    # don't need an `if __name__ == "__main__":` guard, except on Windows where fork
+    # isn't available
+    compile_workers: int = 1
     beats_per_measure: int = 4
+    # bytes/sec budget per port (e.g. bandwidth.DIN_BYTES_PER_SECOND), None sends
+    # everything exactly when it's scheduled
+    bandwidth_limit: Optional[int] = None
+    # with a bandwidth_limit, notes that would be delayed more than this many seconds
+    # are dropped rather than sent late
+    bandwidth_max_delay: Optional[float] = None
+    # how often (at most) the notes being played are printed, None prints nothing
+    visualizer_fps: Optional[float] = 30
+    # compiling fails (naming the lane responsible) before anything is generated if the
+    # song would be bigger than any of these (see cyclemidi.CostEstimate), None is
+    # unlimited
+    max_expanded_chars: Optional[int] = 10_000_000
+    max_cycles: Optional[int] = 100_000
+    max_voices: Optional[int] = 16  # one MIDI channel per voice
+    max_notes: Optional[int] = 5_000_000
+
+
+def process_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    A pool of worker processes that works from song scripts without an
+    `if __name__ == "__main__":` guard.  Workers are forked where that's possible
+    (everywhere but Windows) because spawned workers (the default on macOS) and
+    forkserver ones (Python 3.14 on Linux) re-import the script that started them, and
+    an unguarded script then dies with BrokenProcessPool.
+    """
+    if "fork" in multiprocessing.get_all_start_methods():
+        return ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("fork")
+        )
+    return ProcessPoolExecutor(max_workers=max_workers)
 
 
 midi_note_numbers = {
@@ -60,6 +104,8 @@ def get_note_name(number: int) -> str:
     return f"{note}{octave}"
 
 
+# the same few symbols come up over and over again
+@lru_cache(maxsize=1024)
 def get_midi_note_and_velocity(symbol: str) -> tuple[int, int]:
     m = ASCII_NOTE_RE.search(symbol)
     if m is None:
@@ -108,46 +154,397 @@ def add_clock_messages(
     return all_messages
 
 
-def multi_port_play(
-    midi_ports: list[BaseOutput], config: Config, total_secs: int
-) -> None:
-    midi_file = MidiFile(config.midi_file_name)
+class Clock(Protocol):
+    def time(self) -> float: ...
+
+    def sleep(self, secs: float) -> None: ...
+
+
+class SystemClock:
+    """
+    Real time.  multi_port_play only needs time() and sleep() from a clock so tests and
+    benchmarks can swap in a VirtualClock.
+    """
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, secs: float) -> None:
+        time.sleep(secs)
+
+
+class VirtualClock:
+    """
+    A clock where sleeping returns immediately and just moves time forward, so a song
+    "plays" as fast as the play loop can run.  Any number of threads can share one.
+    """
+
+    def __init__(self, start: float = 0.0) -> None:
+        self.now = start
+        self.lock = threading.Lock()
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, secs: float) -> None:
+        with self.lock:
+            self.now += max(secs, 0.0)
+
+
+class RecordingPort:
+    """
+    Stands in for a mido output port: records every message sent, along with the clock
+    time it was sent at.
+    """
+
+    def __init__(self, clock: Clock, name: str = "recording") -> None:
+        self.clock = clock
+        self.name = name
+        self.sent: list[tuple[float, Message]] = []
+        self.reset_count = 0
+        self.closed = False
+
+    def send(self, message: Message) -> None:
+        self.sent.append((self.clock.time(), message))
+
+    def reset(self) -> None:
+        self.reset_count += 1
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@dataclass
+class PlayStats:
+    events: int = 0
+    loops: int = 0
+    # how far behind schedule (by the clock) messages were sent
+    max_lateness: float = 0.0
+    total_lateness: float = 0.0
+    # wall clock time spent in the play loop other than sleeping
+    overhead_secs: float = 0.0
+
+    @property
+    def mean_lateness(self) -> float:
+        return self.total_lateness / self.events if self.events else 0.0
+
+    @property
+    def overhead_per_event(self) -> float:
+        return self.overhead_secs / self.events if self.events else 0.0
+
+
+def load_messages(config: Config) -> list[Message]:
+    """
+    Everything multi_port_play sends for one loop of the song, with message.time as a
+    0-based offset from the start of the song, in seconds.
+    """
+    return song_messages(MidiFile(config.midi_file_name), config)
+
+
+def song_messages(midi_file: MidiFile, config: Config) -> list[Message]:
     messages = add_clock_messages(list(midi_file), config.beats_per_minute, 24)
-    start_time = time.time()
-    first_loop = True
-    previous_message_type = "note_on"
-    print("=" * 72)
+    if config.bandwidth_limit is not None:
+        messages = stagger_messages(
+            messages, config.bandwidth_limit, config.bandwidth_max_delay
+        )
+    return messages
+
+
+# (channel, MIDI note number) for every note played, or LOOP_EVENT at the end of a loop
+Event = tuple[int, int]
+LOOP_EVENT = (-1, -1)
+
+
+class EventRing:
+    """
+    Fixed size, single producer, single consumer ring buffer of played events.  push()
+    never waits or takes a lock so the play loop can't be held up by the reader; a reader
+    that falls more than size events behind just misses the oldest ones.
+    """
+
+    def __init__(self, size: int = 4096) -> None:
+        self.size = size
+        self.slots: list[Event] = [LOOP_EVENT] * size
+        self.written = 0  # total events ever pushed
+
+    def push(self, event: Event) -> None:
+        self.slots[self.written % self.size] = event
+        self.written += 1
+
+    def read(self, since: int) -> tuple[list[Event], int, int]:
+        """
+        Returns the events pushed since the reader's count of events read, the new count
+        and how many events were missed.
+        """
+        written = self.written
+        start = max(since, written - self.size)
+        events = [self.slots[i % self.size] for i in range(start, written)]
+        # anything the writer lapped while we were copying is garbage
+        overwritten = max(self.written - self.size - start, 0)
+        return (events[overwritten:], written, start + overwritten - since)
+
+
+class ConsoleVisualizer:
+    """
+    Draws what's being played, at most fps times a second, on its own thread so that a
+    slow terminal can never delay a MIDI send.  Each frame is one line per voice
+    (channel) with the notes played since the previous frame, and loops are separated
+    by a line of dashes.
+    """
+
+    def __init__(
+        self, fps: float, out: Optional[TextIO] = None, ring_size: int = 4096
+    ) -> None:
+        self.frame_secs = 1 / fps
+        self.out = out or sys.stdout
+        self.ring = EventRing(ring_size)
+        self.read_count = 0
+        self.dropped = 0
+        self.stopping = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def run(self) -> None:
+        self.out.write("=" * 72 + "\n")
+        while not self.stopping.wait(self.frame_secs):
+            self.draw()
+        self.draw()
+
+    def frame(self, events: list[Event]) -> list[str]:
+        lines: list[str] = []
+        voices: dict[int, list[str]] = {}
+        for event in events + [LOOP_EVENT]:
+            if event == LOOP_EVENT:
+                lines.extend(
+                    f"{channel}: {' '.join(names)}"
+                    for channel, names in sorted(voices.items())
+                )
+                lines.append("-" * 72)
+                voices = {}
+            else:
+                (channel, note) = event
+                voices.setdefault(channel, []).append(get_note_name(note))
+        # the last group isn't the end of a loop
+        return lines[:-1]
+
+    def draw(self) -> None:
+        (events, self.read_count, dropped) = self.ring.read(self.read_count)
+        self.dropped += dropped
+        lines = self.frame(events)
+        if dropped:
+            lines.insert(0, f"({dropped} notes not shown)")
+        if lines:
+            self.out.write("\n".join(lines) + "\n")
+            self.out.flush()
+
+
+def stop_ports(midi_ports: list[BaseOutput], clock: Clock) -> None:
+    for midi_port in midi_ports:
+        midi_port.send(Message("stop", time=clock.time()))
+        midi_port.reset()
+
+
+def play_messages(
+    messages: list[Message],
+    midi_ports: list[BaseOutput],
+    start_time: float,
+    clock: Clock,
+    stats: PlayStats,
+    stop: Optional[threading.Event] = None,
+    ring: Optional[EventRing] = None,
+) -> bool:
+    """
+    Sends every message (whose time is an offset in seconds from start_time) to every
+    port on schedule.  Returns False if stop was set before they were all sent.
+    """
+    for message in messages:
+        if stop is not None and stop.is_set():
+            return False
+        busy_since = time.perf_counter()
+        scheduled_time = message.time + start_time
+        sleep_duration = scheduled_time - clock.time()
+
+        if sleep_duration > 0.0:
+            stats.overhead_secs += time.perf_counter() - busy_since
+            clock.sleep(sleep_duration)
+            busy_since = time.perf_counter()
+
+        if not isinstance(message, MetaMessage):
+            lateness = max(clock.time() - scheduled_time, 0.0)
+            stats.max_lateness = max(stats.max_lateness, lateness)
+            stats.total_lateness += lateness
+            stats.events += 1
+            for midi_port in midi_ports:
+                midi_port.send(message)
+            if ring is not None and is_note_on(message):
+                ring.push((message.channel, message.note))
+
+        stats.overhead_secs += time.perf_counter() - busy_since
+
+    return stop is None or not stop.is_set()
+
+
+def multi_port_play(
+    midi_ports: list[BaseOutput],
+    config: Config,
+    total_secs: int,
+    clock: Optional[Clock] = None,
+    loops: Optional[int] = None,
+    stop: Optional[threading.Event] = None,
+    visualizer: Optional[ConsoleVisualizer] = None,
+) -> PlayStats:
+    """
+    Plays the song on every port, looping forever (or loops times, or until stop is set)
+    and keeping time with clock (real time by default).
+
+    Nothing is printed from here: played notes are pushed onto the visualizer's ring
+    buffer (one is started according to config.visualizer_fps if none is given) and it
+    draws them on its own thread.
+    """
+    clock = clock or SystemClock()
+    messages = load_messages(config)
+    stats = PlayStats()
+    loop_start = clock.time()
+    if visualizer is None and config.visualizer_fps:
+        visualizer = ConsoleVisualizer(config.visualizer_fps)
+    ring = visualizer.ring if visualizer is not None else None
+    if visualizer is not None:
+        visualizer.start()
     try:
-        while True:
-            for message in messages:
-                # after add_clock_messages, every message.time is a 0-based offset from
-                # the start of the song, in seconds... we need to adjust on every successive
-                # loop
-                if not first_loop:
-                    message.time += total_secs
-
-                sleep_duration = (message.time + start_time) - time.time()
-
-                if sleep_duration > 0.0:
-                    if previous_message_type == "note_on":
-                        print("")
-                    time.sleep(sleep_duration)
-
-                if not isinstance(message, MetaMessage):
-                    for midi_port in midi_ports:
-                        if message.type == "note_on":
-                            print(f"{get_note_name(message.note)} ", end="")
-                        midi_port.send(message)
-
-                previous_message_type = message.type
-
-            print("-" * 72)
-            first_loop = False
+        while loops is None or stats.loops < loops:
+            # after add_clock_messages, every message.time is a 0-based offset from the
+            # start of the song, in seconds, so each loop just starts later
+            if not play_messages(
+                messages, midi_ports, loop_start, clock, stats, stop, ring
+            ):
+                break
+            if ring is not None:
+                ring.push(LOOP_EVENT)
+            loop_start += total_secs
+            stats.loops += 1
     except (KeyboardInterrupt, SystemExit):
-        for midi_port in midi_ports:
-            midi_port.send(Message("stop", time=time.time()))
-            midi_port.reset()
+        stop_ports(midi_ports, clock)
         sys.exit(1)
+    else:
+        stop_ports(midi_ports, clock)
+    finally:
+        # after the ports are stopped since this waits for the last frame to be drawn
+        if visualizer is not None:
+            visualizer.stop()
+
+    return stats
+
+
+@dataclass
+class PortPoolStats:
+    opens: int = 0
+    reuses: int = 0
+    reconnects: int = 0
+
+
+class PooledPort:
+    """
+    A shared handle on one of a PortPool's ports.  If sending fails the pool reopens the
+    port and the message is sent again, once.  Closing a handle does nothing: the pool
+    owns the port.
+    """
+
+    def __init__(self, pool: PortPool, name: str) -> None:
+        self.pool = pool
+        self.name = name
+
+    def call(self, method: str, *args: Any) -> None:
+        try:
+            getattr(self.pool.port(self.name), method)(*args)
+        except Exception:
+            getattr(self.pool.reconnect(self.name), method)(*args)
+
+    def send(self, message: Message) -> None:
+        self.call("send", message)
+
+    def reset(self) -> None:
+        self.call("reset")
+
+    def close(self) -> None:
+        pass
+
+
+class PortPool:
+    """
+    Opens each output port the first time it's asked for and keeps it open (opening a
+    port can take hundreds of milliseconds on some backends) so that every play after
+    the first starts straight away.  All the ports are closed when the process exits.
+    """
+
+    def __init__(
+        self, open_output: Optional[Callable[[str], BaseOutput]] = None
+    ) -> None:
+        self.open_output = open_output
+        self.ports: dict[str, BaseOutput] = {}
+        self.handles: dict[str, PooledPort] = {}
+        self.stats = PortPoolStats()
+        self.lock = threading.Lock()
+
+    def open(self, name: str) -> BaseOutput:
+        if self.open_output is None:
+            self.open_output = Backend().open_output
+        port = self.open_output(name)
+        self.stats.opens += 1
+        return port
+
+    def port(self, name: str) -> BaseOutput:
+        with self.lock:
+            if name not in self.ports:
+                self.ports[name] = self.open(name)
+            return self.ports[name]
+
+    def get(self, names: list[str]) -> list[PooledPort]:
+        handles = []
+        for name in names:
+            self.port(name)
+            with self.lock:
+                if name in self.handles:
+                    self.stats.reuses += 1
+                else:
+                    self.handles[name] = PooledPort(self, name)
+                handles.append(self.handles[name])
+        return handles
+
+    def reconnect(self, name: str) -> BaseOutput:
+        with self.lock:
+            port = self.ports.pop(name, None)
+            if port is not None:
+                try:
+                    port.close()
+                except Exception:
+                    pass
+            self.ports[name] = self.open(name)
+            self.stats.reconnects += 1
+            return self.ports[name]
+
+    def close(self) -> None:
+        with self.lock:
+            for port in self.ports.values():
+                port.close()
+            self.ports = {}
+            self.handles = {}
+
+
+port_pool = PortPool()
+atexit.register(port_pool.close)
+
+# when set (e.g. by watch mode), play_midi hands the song to this instead of playing it
+play_handler: Optional[Callable[[Config, int], None]] = None
 
 
 def play_midi(config: Config, total_secs: int) -> None:
@@ -155,15 +552,8 @@ def play_midi(config: Config, total_secs: int) -> None:
     if not config.midi_devices:
         return
 
-    backend = Backend()
-    assert len(config.midi_devices) < 3
+    if play_handler is not None:
+        play_handler(config, total_secs)
+        return
 
-    if len(config.midi_devices) == 2:
-        with (
-            backend.open_output(config.midi_devices[0]) as midi_port1,
-            backend.open_output(config.midi_devices[1]) as midi_port2,
-        ):
-            multi_port_play([midi_port1, midi_port2], config, total_secs)
-    else:
-        with backend.open_output(config.midi_devices[0]) as midi_port:
-            multi_port_play([midi_port], config, total_secs)
+    multi_port_play(port_pool.get(config.midi_devices), config, total_secs)
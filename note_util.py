@@ -1,5 +1,8 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 from types import GeneratorType
 
+from asciimidi import ascii_to_midi, play_ascii
 from midi import ASCII_NOTE_RE
 
 def handle_mixed_args(args):
@@ -31,6 +34,51 @@ def make_lines(*args):
         concat(bars[i:i+2]) for i in range(0, len(bars), 2)
     ]
 
+class Score:
+    """
+    Builds up a piece measure by measure.  Unlike repeatedly calling concat(), each measure
+    is split into its layers once, when it's added, and the text is only joined back
+    together when it's asked for so building a piece is linear in the number of measures.
+
+    lines() gives the same result as make_lines() and text() the same as concat() on all
+    of the measures.
+    """
+    def __init__(self, *measures, bars_per_line=2):
+        self.bars_per_line = bars_per_line
+        self.columns = []
+        self.add(*measures)
+
+    def add(self, *args):
+        for measure in handle_mixed_args(args):
+            layers = measure.split("\n")
+            assert not self.columns or len(layers) == len(self.columns[0])
+            self.columns.append(layers)
+        return self
+
+    def join(self, columns):
+        return stack("   ".join(layer) for layer in zip(*columns))
+
+    def lines(self):
+        return [
+            self.join(self.columns[i:i+self.bars_per_line])
+            for i in range(0, len(self.columns), self.bars_per_line)
+        ]
+
+    def text(self):
+        return self.join(self.columns)
+
+    def __str__(self):
+        return self.text()
+
+    def __len__(self):
+        return len(self.columns)
+
+    def midi(self, config):
+        return ascii_to_midi([self.text()], config)
+
+    def play(self, config):
+        play_ascii([self.text()], config)
+
 def key_pitches(key_root, mode, semis):
     pitches = SHARP_PITCHES if f"{key_root} {mode}" in SHARPS_KEYS else FLAT_PITCHES
     root_index = pitches.index(key_root)
@@ -120,36 +168,94 @@ FIXED_INTERVALS = {
     P8: 12,
 }
 
-global_key = None
-def set_key(key):
-    global global_key
+# The current key lives in a context variable rather than a plain global so that songs
+# rendered concurrently (in threads or asyncio tasks) each see their own key.  Note that
+# a new thread starts out with no key: set one inside it (or use `with key(...)`).
+current_key = ContextVar("current_key", default=None)
+
+def validate_key(key):
     root, mode = key.split()
     assert root[0] in ("A", "B", "C", "D", "E", "F", "G")
     assert len(root) < 3
     if len(root) > 1: 
         assert root[1] in ("#", "b")
     assert mode.startswith("maj") or mode.startswith("min") or mode.startswith("phr")
-    global_key = key
+
+def set_key(key):
+    validate_key(key)
+    current_key.set(key)
+
+def get_key():
+    return current_key.get()
+
+@contextmanager
+def key(k):
+    """
+    Sets the key for the duration of a with block, e.g.:
+
+    with key("E minor"):
+        ...
+    """
+    validate_key(k)
+    token = current_key.set(k)
+    try:
+        yield k
+    finally:
+        current_key.reset(token)
+
+# pitch name -> semitones above C, for both spellings
+PITCH_SEMITONES = {
+    **{pitch: i for i, pitch in enumerate(SHARP_PITCHES)},
+    **{pitch: i for i, pitch in enumerate(FLAT_PITCHES)},
+}
+
+# key -> pitch name -> index of that pitch within the key (see key_pitches())
+KEY_DEGREES = {key: {pitch: i for i, pitch in enumerate(pitches)} for key, pitches in KEYS.items()}
+
+# note string -> parsed fields, so that each distinct string only hits the regex once
+parsed_notes = {}
+
+# (pitch, octave, up_volume, down_volume, key) -> the one Note instance with those fields
+interned_notes = {}
 
 class Note:
-    def __init__(self, s, key=None):
-        m = ASCII_NOTE_RE.search(s)
-        self.pitch, self.octave, self.up_volume, self.down_volume = m.groups()
-        self.octave = int(self.octave)
+    """
+    Notes are immutable and interned: there is only ever one instance for a given pitch,
+    octave, volume and key.  The MIDI number and the index of the note within its key
+    ("degree", counting 7 per octave) are computed once, when the instance is created,
+    so arithmetic on notes is just integer math and table lookups.
+    """
+    __slots__ = ("pitch", "octave", "up_volume", "down_volume", "key", "midi", "degree", "_hash")
+
+    def __new__(cls, s, key=None):
+        parsed = parsed_notes.get(s)
+        if parsed is None:
+            m = ASCII_NOTE_RE.search(s)
+            pitch, octave, up_volume, down_volume = m.groups()
+            parsed = parsed_notes[s] = (pitch, int(octave), up_volume, down_volume)
         if key:
             set_key(key)
         else:
-            key = global_key
+            key = get_key()
         assert key
-        self.key = key
+        return make_note(*parsed, key)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Note is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Note is immutable")
+
+    def __reduce__(self):
+        return (make_note, (self.pitch, self.octave, self.up_volume, self.down_volume, self.key))
 
     def __eq__(self, other):
-        return (isinstance(other, self.__class__)
-            and self.__dict__ == other.__dict__)
+        return self is other or (isinstance(other, self.__class__)
+            and (self.pitch, self.octave, self.up_volume, self.down_volume, self.key)
+            == (other.pitch, other.octave, other.up_volume, other.down_volume, other.key))
 
     def __hash__(self):
-        """Overrides the default implementation"""
-        return hash(tuple(sorted(self.__dict__.items())))
+        return self._hash
 
     def __str__(self):
         return self.pitch+str(self.octave)+self.up_volume+self.down_volume
@@ -177,18 +283,120 @@ class Note:
     def __format__(self, format_spec):
         return format(str(self), format_spec)
 
+def make_note(pitch, octave, up_volume, down_volume, key):
+    """
+    Returns the interned Note with these fields, creating it if necessary.  Skips the
+    parsing and key bookkeeping that Note() does.
+    """
+    fields = (pitch, octave, up_volume, down_volume, key)
+    note = interned_notes.get(fields)
+    if note is None:
+        note = object.__new__(Note)
+        for name, value in zip(Note.__slots__, fields):
+            object.__setattr__(note, name, value)
+        semitone = PITCH_SEMITONES.get(pitch)
+        degree = KEY_DEGREES.get(key, {}).get(pitch)
+        object.__setattr__(note, "midi", None if semitone is None else 12 * (octave + 1) + semitone)
+        object.__setattr__(note, "degree", None if degree is None else degree + 7 * octave)
+        object.__setattr__(note, "_hash", hash(fields))
+        # setdefault so that if two threads race to create the same note they agree on one
+        note = interned_notes.setdefault(fields, note)
+    return note
+
 def n(s, key=None):
     return Note(s, key)
 
+# enough octaves to cover the MIDI range; anything outside falls back to make_note()
+TABLE_OCTAVES = 11
+key_note_tables = {}
+chromatic_note_tables = {}
+
+def key_note_table(key):
+    """
+    Every note of the key from octave 0 up, indexed by degree (see Note.degree).
+    """
+    table = key_note_tables.get(key)
+    if table is None:
+        table = key_note_tables[key] = [
+            make_note(KEYS[key][i % 7], i // 7, "", "", key) for i in range(7 * TABLE_OCTAVES)
+        ]
+    return table
+
+def chromatic_note_table(pitches, key):
+    """
+    Every note from C-1 up using the given spelling, indexed by MIDI number.
+    """
+    table = chromatic_note_tables.get((pitches[1], key))
+    if table is None:
+        table = chromatic_note_tables[(pitches[1], key)] = [
+            make_note(pitches[i % 12], i // 12 - 1, "", "", key) for i in range(12 * TABLE_OCTAVES)
+        ]
+    return table
+
+def broadcast(values, count):
+    if isinstance(values, int):
+        return [values] * count
+    values = list(values)
+    assert len(values) == count
+    return values
+
+def add_scale_steps_batch(notes, scale_steps, key=None):
+    """
+    Batch version of add_scale_steps: takes a list of notes and either a single number of
+    scale steps or a list with one per note and returns the list of resulting notes.  All
+    the notes must be in the key.
+    """
+    if key:
+        set_key(key)
+    else:
+        key = get_key()
+    assert key
+    notes = list(notes)
+    key_degrees = KEY_DEGREES[key]
+    try:
+        indexes = [
+            (note.degree if note.key == key else key_degrees[note.pitch] + 7 * note.octave) + steps
+            for note, steps in zip(notes, broadcast(scale_steps, len(notes)))
+        ]
+    except (KeyError, TypeError):
+        raise ValueError(f"not all of {[str(note) for note in notes]} are in {key}")
+    table = key_note_table(key)
+    size = len(table)
+    pitches = KEYS[key]
+    return [
+        table[i] if 0 <= i < size else make_note(pitches[i % 7], i // 7, "", "", key)
+        for i in indexes
+    ]
+
+def add_semitones_batch(notes, semitones):
+    """
+    Batch version of add_semitones: takes a list of notes and either a single number of
+    semitones or a list with one per note and returns the list of resulting notes.
+    """
+    key = get_key()
+    assert key
+    notes = list(notes)
+    sharp_table = chromatic_note_table(SHARP_PITCHES, key)
+    flat_table = chromatic_note_table(FLAT_PITCHES, key)
+    size = len(sharp_table)
+    try:
+        return [
+            (flat_table if note.pitch[-1] == "b" else sharp_table)[note.midi + steps]
+            if 0 <= note.midi + steps < size else add_semitones(note, steps)
+            for note, steps in zip(notes, broadcast(semitones, len(notes)))
+        ]
+    except TypeError:
+        raise ValueError(f"can't add semitones to all of {[str(note) for note in notes]}")
+
 def add_semitones(note, semitones):
-    pitch, octave = note.pitch, note.octave
-    pitches = FLAT_PITCHES if pitch[-1] == "b" else SHARP_PITCHES
-    i = pitches.index(pitch)
-    i += semitones
-    octave += i // len(pitches)
-    pitch = pitches[i % len(pitches)]
+    if note.midi is None:
+        raise ValueError(f"can't add semitones to {note}")
+    pitches = FLAT_PITCHES if note.pitch[-1] == "b" else SHARP_PITCHES
+    midi = note.midi + semitones
+    key = get_key()
+    assert key
 
-    return n(pitch+str(octave))
+    return make_note(pitches[midi % 12], midi // 12 - 1, "", "", key)
 
 def add_scale_steps(note, scale_steps, key=None):
     """
@@ -211,14 +419,16 @@ def add_scale_steps(note, scale_steps, key=None):
     if key:
         set_key(key)
     else:
-        key = global_key
+        key = get_key()
     assert key
-    key_pitches = KEYS[key]
-
-    # note: this only works because we rotate all key pitch lists to start with C/C#/Db
-    note_index = key_pitches.index(note.pitch) + (7 * note.octave)
+    if note.key == key and note.degree is not None:
+        note_index = note.degree
+    else:
+        degree = KEY_DEGREES[key].get(note.pitch)
+        if degree is None:
+            raise ValueError(f"{note.pitch} is not in {key}")
+        # note: this only works because we rotate all key pitch lists to start with C/C#/Db
+        note_index = degree + (7 * note.octave)
     new_index = note_index + scale_steps
-    new_pitch = key_pitches[new_index % 7]
-    new_octave = new_index // 7
 
-    return n(new_pitch+str(new_octave))
+    return make_note(KEYS[key][new_index % 7], new_index // 7, "", "", key)
@@ -0,0 +1,242 @@
+from collections import OrderedDict
+from dataclasses import replace
+from fractions import Fraction
+from math import ceil, floor
+from typing import Callable, Union
+
+from cyclemidi import (
+    CycleListType,
+    TreeNode,
+    Voice,
+    build_cycle_tree,
+    expand_alternatives,
+    expand_repeats,
+    generate_chunk,
+    max_voice_count,
+    split_cycles,
+)
+
+###
+# A lazy alternative to materializing a whole cycle list: a Pattern answers "which notes
+# start in [begin, end)" (times in cycles) for any span, generating only the cycles it
+# needs.  A compiled cycle list repeats forever so there's no end to a pattern; a
+# transformation (fast, rev, every, ...) is just a new query function wrapped around the
+# old one, evaluated when the pattern is queried.
+###
+
+Time = Union[Fraction, int]
+
+# how many spans each pattern remembers the answer for
+QUERY_CACHE_SIZE = 256
+
+
+def add_voices(voices: list[Voice], more: list[Voice]) -> None:
+    for i, voice in enumerate(more):
+        if i == len(voices):
+            voices.append([])
+        voices[i].extend(voice)
+
+
+def shift_voices(voices: list[Voice], offset: Fraction) -> list[Voice]:
+    if not offset:
+        return voices
+    return [
+        [
+            replace(note, start=note.start + offset, end=note.end + offset)
+            for note in voice
+        ]
+        for voice in voices
+    ]
+
+
+def cycle_spans(begin: Fraction, end: Fraction) -> list[tuple[int, Fraction, Fraction]]:
+    """
+    Splits [begin, end) at cycle boundaries, returns (cycle, begin, end) for each piece.
+    """
+    return [
+        (cycle, max(begin, Fraction(cycle)), min(end, Fraction(cycle + 1)))
+        for cycle in range(floor(begin), ceil(end))
+    ]
+
+
+class Pattern:
+    """
+    Wraps a query function that returns the voices (with notes in time order) of every
+    note that starts in [begin, end).  Answers are cached per span so the voices
+    returned must never be modified.
+    """
+
+    def __init__(self, query: Callable[[Fraction, Fraction], list[Voice]]) -> None:
+        self.query_func = query
+        self.cache: OrderedDict[tuple[Fraction, Fraction], list[Voice]] = OrderedDict()
+
+    def query(self, begin: Time, end: Time) -> list[Voice]:
+        span = (Fraction(begin), Fraction(end))
+        if span in self.cache:
+            self.cache.move_to_end(span)
+            return self.cache[span]
+        voices = self.query_func(*span) if span[0] < span[1] else []
+        self.cache[span] = voices
+        if len(self.cache) > QUERY_CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return voices
+
+    def fast(self, factor: Time) -> "Pattern":
+        """
+        Plays factor times as many cycles per cycle.
+        """
+        factor = Fraction(factor)
+        assert factor > 0
+
+        def query(begin: Fraction, end: Fraction) -> list[Voice]:
+            return [
+                [
+                    replace(note, start=note.start / factor, end=note.end / factor)
+                    for note in voice
+                ]
+                for voice in self.query(begin * factor, end * factor)
+            ]
+
+        return Pattern(query)
+
+    def slow(self, factor: Time) -> "Pattern":
+        return self.fast(1 / Fraction(factor))
+
+    def shift(self, offset: Time) -> "Pattern":
+        """
+        Starts the pattern offset cycles later.
+        """
+        offset = Fraction(offset)
+        return Pattern(
+            lambda begin, end: shift_voices(
+                self.query(begin - offset, end - offset), offset
+            )
+        )
+
+    def rev(self) -> "Pattern":
+        """
+        Reverses each cycle.  Notes tied over into the next cycle are cut off at the
+        end of their own cycle first.
+        """
+
+        def query(begin: Fraction, end: Fraction) -> list[Voice]:
+            voices: list[Voice] = []
+            for cycle, span_begin, span_end in cycle_spans(begin, end):
+                # the first note in the reversed span is the last one in the original
+                reflected_begin = 2 * cycle + 1 - span_end
+                reflected_end = 2 * cycle + 1 - span_begin
+                cycle_voices = []
+                for voice in self.query(cycle, cycle + 1):
+                    reversed_voice = []
+                    for note in reversed(voice):
+                        note_end = min(note.end, Fraction(cycle + 1))
+                        if reflected_begin < note_end <= reflected_end:
+                            reversed_voice.append(
+                                replace(
+                                    note,
+                                    start=2 * cycle + 1 - note_end,
+                                    end=2 * cycle + 1 - note.start,
+                                )
+                            )
+                    cycle_voices.append(reversed_voice)
+                add_voices(voices, cycle_voices)
+            return voices
+
+        return Pattern(query)
+
+    def every(self, n: int, transform: Callable[["Pattern"], "Pattern"]) -> "Pattern":
+        """
+        Applies transform to every nth cycle, starting with the first.
+        """
+        transformed = transform(self)
+
+        def query(begin: Fraction, end: Fraction) -> list[Voice]:
+            voices: list[Voice] = []
+            for cycle, span_begin, span_end in cycle_spans(begin, end):
+                pattern = transformed if cycle % n == 0 else self
+                add_voices(voices, pattern.query(span_begin, span_end))
+            return voices
+
+        return Pattern(query)
+
+
+class TreePattern(Pattern):
+    """
+    A compiled cycle list, repeated forever.  Each of its cycles is generated (at most)
+    once however many times it repeats and however the pattern is queried.
+    """
+
+    def __init__(
+        self, tree: TreeNode, cycle_list_type: CycleListType, voice_count: int
+    ) -> None:
+        super().__init__(self.query_cycles)
+        self.tree = tree
+        self.cycle_list_type = cycle_list_type
+        self.voice_count = voice_count
+        # top level repeats are expanded (by reference) so there's one entry per cycle
+        self.tree_cycles = expand_repeats(tree.children)
+        self.cycle_count = len(self.tree_cycles)
+        self.cycles: dict[int, tuple[list[Fraction], list[Voice]]] = {}
+        self.tails: dict[tuple[int, int], Fraction] = {}
+
+    def cycle(self, index: int) -> tuple[list[Fraction], list[Voice]]:
+        """
+        Leading ties and voices (see generate_chunk) of the cycle at index, without the
+        ties from the following cycles applied.
+        """
+        if index not in self.cycles:
+            cycles = [self.tree_cycles[index]]
+            self.cycles[index] = generate_chunk(
+                (cycles, index, self.cycle_list_type, self.voice_count)
+            )
+        return self.cycles[index]
+
+    def tail(self, index: int, voice: int) -> Fraction:
+        """
+        How much the last note of the voice in the cycle at index is extended by ties in
+        the cycles after it.
+        """
+        if (index, voice) not in self.tails:
+            tail = Fraction(0)
+            for following in range(index + 1, index + 1 + self.cycle_count):
+                (ties, voices) = self.cycle(following % self.cycle_count)
+                tail += ties[voice]
+                if voice < len(voices) and voices[voice]:
+                    break
+            else:
+                raise Exception(f"Voice {voice} is nothing but ties")
+            self.tails[(index, voice)] = tail
+        return self.tails[(index, voice)]
+
+    def query_cycles(self, begin: Fraction, end: Fraction) -> list[Voice]:
+        voices: list[Voice] = []
+        for cycle, span_begin, span_end in cycle_spans(begin, end):
+            index = cycle % self.cycle_count
+            (_, cycle_voices) = self.cycle(index)
+            offset = Fraction(cycle - index)
+            span_voices = []
+            for i, voice in enumerate(cycle_voices):
+                last = len(voice) - 1
+                span_voices.append(
+                    [
+                        replace(
+                            note,
+                            start=note.start + offset,
+                            end=note.end
+                            + offset
+                            + (self.tail(index, i) if j == last else 0),
+                        )
+                        for j, note in enumerate(voice)
+                        if span_begin <= note.start + offset < span_end
+                    ]
+                )
+            add_voices(voices, span_voices)
+        return voices
+
+
+def pattern(
+    cycle_list: str, cycle_list_type: CycleListType = CycleListType.NOTES
+) -> TreePattern:
+    expanded = expand_alternatives(cycle_list)
+    tree = build_cycle_tree(split_cycles(expanded))
+    return TreePattern(tree, cycle_list_type, max_voice_count(expanded))
@@ -0,0 +1,203 @@
+from __future__ import annotations  # so that methods can return Playlists
+import logging
+import sys
+import threading
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+from mido import Message  # type: ignore
+from mido.ports import BaseOutput  # type: ignore
+
+from cyclemidi import (
+    CycleList,
+    Cycles,
+    build_midi_file,
+    estimate_cost,
+    parse_cycle_lists,
+    song_secs,
+)
+from midi import (
+    LOOP_EVENT,
+    Clock,
+    Config,
+    ConsoleVisualizer,
+    PlayStats,
+    SystemClock,
+    play_messages,
+    port_pool,
+    process_pool,
+    song_messages,
+    stop_ports,
+)
+
+logger = logging.getLogger(__name__)
+
+###
+# Plays a set of songs (or sections) back to back without stopping in between: while
+# one plays the next ones are compiled on a background worker, and each starts on the
+# cycle boundary where the one before it ends, as if they were one long song.
+###
+
+
+@dataclass
+class PlaylistEntry:
+    cycles: Cycles
+    loops: int = 1
+
+
+@dataclass
+class CompiledEntry:
+    # everything sent for one loop, message.time being seconds from the loop's start
+    messages: list[Message]
+    total_secs: float
+
+
+CompileJob = tuple[list[CycleList], Config]
+
+
+def compile_entry(job: CompileJob) -> CompiledEntry:
+    """
+    Compiles a song into its messages without writing a MIDI file.  Runs on the
+    playlist's worker so it only takes picklable arguments.
+    """
+    (cycle_lists, config) = job
+    estimate_cost(cycle_lists).check(config)
+    (voices, cycle_count) = parse_cycle_lists(cycle_lists, config.compile_workers)
+    midi_file = build_midi_file(voices, config)
+    return CompiledEntry(
+        song_messages(midi_file, config),
+        song_secs(cycle_count, config, midi_file.ticks_per_beat),
+    )
+
+
+@dataclass
+class PlaylistStats(PlayStats):
+    # (entry index, seconds) for each entry that was still compiling when it should have
+    # started, so started late
+    late_starts: list[tuple[int, float]] = field(default_factory=list)
+
+    @property
+    def late_compiles(self) -> int:
+        return len(self.late_starts)
+
+
+class Playlist:
+    def __init__(
+        self,
+        lookahead: int = 1,
+        processes: bool = True,
+        compile: Callable[[CompileJob], CompiledEntry] = compile_entry,
+    ) -> None:
+        """
+        lookahead is how many entries after the one playing are compiled (or being
+        compiled) at a time.  They're compiled one at a time in a worker process (or
+        thread, if processes is False) so compiling doesn't hold up the play loop.  The
+        worker is forked where possible (see midi.process_pool), elsewhere the script
+        that plays the playlist needs an `if __name__ == "__main__":` guard.
+        """
+        self.entries: list[PlaylistEntry] = []
+        self.lookahead = lookahead
+        self.processes = processes
+        self.compile = compile
+        # only the ports (midi_devices) and visualizer_fps are used, each song is
+        # compiled with its own config
+        self.config: Config = Config()
+
+    # "public" methods
+    def add(self, cycles: Cycles, loops: int = 1) -> Playlist:
+        assert loops > 0
+        self.entries.append(PlaylistEntry(cycles, loops))
+        return self
+
+    def set_config(self, param: str, val: Any) -> Playlist:
+        setattr(self.config, param, val)
+        return self
+
+    def play(
+        self,
+        midi_ports: Optional[list[BaseOutput]] = None,
+        clock: Optional[Clock] = None,
+        stop: Optional[threading.Event] = None,
+        visualizer: Optional[ConsoleVisualizer] = None,
+    ) -> PlaylistStats:
+        """
+        Plays every entry in order, each one loops times, and then stops.  The first
+        entry starts as soon as it's compiled.  An entry that isn't compiled by the time
+        the one before it ends starts as soon as it is, is counted in late_starts and
+        logs a warning.
+        """
+        if midi_ports is None:
+            midi_ports = port_pool.get(self.config.midi_devices)
+        clock = clock or SystemClock()
+        stats = PlaylistStats()
+        if visualizer is None and self.config.visualizer_fps:
+            visualizer = ConsoleVisualizer(self.config.visualizer_fps)
+        ring = visualizer.ring if visualizer is not None else None
+        executor: Executor = (
+            process_pool(1) if self.processes else ThreadPoolExecutor(max_workers=1)
+        )
+        futures: dict[int, Future[CompiledEntry]] = {}
+
+        def submit(i: int) -> None:
+            for j in range(i, min(i + 1 + self.lookahead, len(self.entries))):
+                if j not in futures:
+                    cycles = self.entries[j].cycles
+                    futures[j] = executor.submit(
+                        self.compile, (cycles.cycle_lists, cycles.config)
+                    )
+
+        # the worker process is forked on the first submit, before the visualizer's
+        # thread is started
+        submit(0)
+        if visualizer is not None:
+            visualizer.start()
+        try:
+            # when the next pass should start, None until the first entry is compiled
+            next_start: Optional[float] = None
+            for i, entry in enumerate(self.entries):
+                submit(i)
+                compiled = futures.pop(i).result()
+
+                now = clock.time()
+                if next_start is None:
+                    next_start = now
+                elif now > next_start:
+                    stats.late_starts.append((i, now - next_start))
+                    logger.warning(
+                        "Playlist entry %d finished compiling %.3fs after it should"
+                        " have started, starting it now",
+                        i,
+                        now - next_start,
+                    )
+                    next_start = now
+
+                without_start = [m for m in compiled.messages if m.type != "start"]
+                for loop in range(entry.loops):
+                    # the MIDI start message is only sent once, the songs are continuous
+                    messages = without_start if stats.loops else compiled.messages
+                    if not play_messages(
+                        messages, midi_ports, next_start, clock, stats, stop, ring
+                    ):
+                        break
+                    if ring is not None:
+                        ring.push(LOOP_EVENT)
+                    next_start += compiled.total_secs
+                    stats.loops += 1
+                if stop is not None and stop.is_set():
+                    break
+        except (KeyboardInterrupt, SystemExit):
+            stop_ports(midi_ports, clock)
+            sys.exit(1)
+        except Exception:
+            # e.g. an entry that didn't compile, stop what's playing before raising
+            stop_ports(midi_ports, clock)
+            raise
+        else:
+            stop_ports(midi_ports, clock)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            if visualizer is not None:
+                visualizer.stop()
+
+        return stats
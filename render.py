@@ -0,0 +1,272 @@
+from typing import Any, Optional, Union
+import struct
+import wave
+
+import numpy as np
+
+from cyclemidi import Voice, REST_LITERAL, note_timing
+from midi import get_midi_note_and_velocity, Config
+
+###
+# Offline rendering of voices to audio, for when there's no MIDI device to play them on.
+# Everything is done with whole-array NumPy operations over each note's block of samples,
+# there's no per-sample Python code.
+###
+
+SAMPLE_RATE = 44100
+ATTACK_SECS = 0.005
+RELEASE_SECS = 0.03
+# leaves headroom for a handful of simultaneous voices before normalizing kicks in
+VOICE_GAIN = 0.25
+# samples are mixed in blocks of this many frames so that mixing needs the same small
+# scratch buffer however long the samples are and however many hits there are
+MIX_BLOCK_FRAMES = 4096
+
+
+def seconds_per_cycle(config: Config) -> float:
+    return config.beats_per_measure * 60 / config.beats_per_minute
+
+
+def note_events(
+    voices: list[Voice], config: Config
+) -> list[tuple[float, float, int, int]]:
+    """
+    Returns (start secs, duration secs, MIDI note number, velocity) for every sounding
+    note, using the same timing as the MIDI output.
+    """
+    cycle_secs = seconds_per_cycle(config)
+    events = []
+    for voice in voices:
+        for note in voice:
+            if note.pitch == REST_LITERAL:
+                continue
+            (note_on, note_duration) = note_timing(note, config)
+            midi_note, velocity = get_midi_note_and_velocity(note.pitch)
+            if note.velocity is not None:
+                velocity = note.velocity
+            events.append(
+                (
+                    float(note_on) * cycle_secs,
+                    float(note_duration) * cycle_secs,
+                    midi_note,
+                    velocity,
+                )
+            )
+    return events
+
+
+def oscillator(waveform: str, phase: Any) -> Any:
+    """
+    phase is an array of phases measured in cycles (not radians).
+    """
+    if waveform == "sine":
+        return np.sin(2 * np.pi * phase)
+    cycle_position = phase % 1.0
+    if waveform == "saw":
+        return 2 * cycle_position - 1
+    elif waveform == "square":
+        return np.where(cycle_position < 0.5, 1.0, -1.0)
+    elif waveform == "triangle":
+        return 1 - 4 * np.abs(cycle_position - 0.5)
+
+    raise Exception(f"Unexpected waveform: {waveform}")
+
+
+def envelope(sample_count: int, sustain_count: int, sample_rate: int) -> Any:
+    """
+    Linear attack up to the note's full level, held until the note ends (after
+    sustain_count samples) then a linear release.
+    """
+    t = np.arange(sample_count) / sample_rate
+    sustain_secs = sustain_count / sample_rate
+    attack_secs = min(ATTACK_SECS, sustain_secs)
+    return np.interp(
+        t,
+        [0.0, attack_secs, sustain_secs, sustain_secs + RELEASE_SECS],
+        [0.0, 1.0, 1.0, 0.0],
+    )
+
+
+def render_voices(
+    voices: list[Voice],
+    config: Config,
+    total_secs: Optional[float] = None,
+    sample_rate: int = SAMPLE_RATE,
+    waveform: str = "sine",
+) -> Any:
+    """
+    Mixes all the voices down to a mono float array in [-1, 1].  The result is at least
+    total_secs long and long enough for the last note's release.
+    """
+    events = note_events(voices, config)
+    release_count = int(RELEASE_SECS * sample_rate)
+    end_secs = max((start + duration for start, duration, _, _ in events), default=0.0)
+    length = max(
+        int((total_secs or 0) * sample_rate),
+        int(end_secs * sample_rate) + release_count,
+    )
+    out = np.zeros(length)
+
+    for start_secs, duration_secs, midi_note, velocity in events:
+        start = int(start_secs * sample_rate)
+        sustain_count = max(1, int(duration_secs * sample_rate))
+        sample_count = min(sustain_count + release_count, length - start)
+        frequency = 440.0 * 2 ** ((midi_note - 69) / 12)
+        phase = np.arange(sample_count) * (frequency / sample_rate)
+        block = oscillator(waveform, phase)
+        block *= envelope(sample_count, sustain_count, sample_rate)
+        block *= VOICE_GAIN * velocity / 127
+        out[start : start + sample_count] += block
+
+    peak = np.max(np.abs(out), initial=0.0)
+    if peak > 1.0:
+        out /= peak
+    return out
+
+
+def write_wav(samples: Any, file_name: str, sample_rate: int = SAMPLE_RATE) -> None:
+    pcm = np.round(np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(file_name, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm.tobytes())
+
+
+def render_wav(
+    voices: list[Voice],
+    config: Config,
+    file_name: str,
+    total_secs: Optional[float] = None,
+    sample_rate: int = SAMPLE_RATE,
+    waveform: str = "sine",
+) -> Any:
+    samples = render_voices(voices, config, total_secs, sample_rate, waveform)
+    write_wav(samples, file_name, sample_rate)
+    return samples
+
+
+def find_wav_data(file_name: str) -> tuple[int, int, int, int, int]:
+    """
+    Walks the RIFF chunks of a WAV file and returns (data offset, frame count, channel
+    count, sample width in bytes, sample rate) so that the data can be mapped directly.
+    """
+    with open(file_name, "rb") as f:
+        (riff, _, wave_id) = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise Exception(f"Not a WAV file: {file_name}")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise Exception(f"No data in WAV file: {file_name}")
+            (chunk_id, chunk_size) = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(chunk_size - 16 + (chunk_size % 2), 1)
+            elif chunk_id == b"data":
+                if fmt is None:
+                    raise Exception(f"No format before data in WAV file: {file_name}")
+                (audio_format, channels, rate, _, block_align, bits) = fmt
+                if audio_format != 1 or bits != 16:
+                    raise Exception(
+                        f"Only 16 bit PCM WAV files are supported: {file_name}"
+                    )
+                return (f.tell(), chunk_size // block_align, channels, bits // 8, rate)
+            else:
+                # chunks are padded to an even number of bytes
+                f.seek(chunk_size + (chunk_size % 2), 1)
+
+
+def load_sample(file_name: str, sample_rate: int = SAMPLE_RATE) -> Any:
+    """
+    Memory maps a WAV file's data as a read-only (frames, channels) int16 array.  Nothing
+    is read until it's mixed and the OS shares the pages between every use.
+    """
+    (offset, frames, channels, _, rate) = find_wav_data(file_name)
+    if rate != sample_rate:
+        raise Exception(f"{file_name} is {rate}Hz, expected {sample_rate}Hz")
+    return np.memmap(
+        file_name, dtype="<i2", mode="r", offset=offset, shape=(frames, channels)
+    )
+
+
+class SampleBank:
+    """
+    Maps MIDI note numbers to memory-mapped one-shot samples.  Each file is mapped once
+    however many times it's hit.
+    """
+
+    def __init__(self, samples: dict[int, str], sample_rate: int = SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.samples = {
+            note: load_sample(file_name, sample_rate)
+            for note, file_name in samples.items()
+        }
+
+    def __getitem__(self, note: int) -> Any:
+        return self.samples[note]
+
+    def __contains__(self, note: int) -> bool:
+        return note in self.samples
+
+
+def mix_sample(out: Any, start: int, sample: Any, gain: float, scratch: Any) -> None:
+    """
+    Adds sample (int16, frames x channels), scaled by gain and mixed down to mono, into
+    out starting at frame start, one block at a time through scratch.
+    """
+    (frames, channels) = sample.shape
+    frames = min(frames, len(out) - start)
+    gain = gain / (32768 * channels)
+    for block_start in range(0, frames, MIX_BLOCK_FRAMES):
+        block_end = min(block_start + MIX_BLOCK_FRAMES, frames)
+        block = scratch[: block_end - block_start]
+        target = out[start + block_start : start + block_end]
+        for channel in range(channels):
+            np.multiply(sample[block_start:block_end, channel], gain, out=block)
+            target += block
+
+
+def render_samples(
+    voices: list[Voice],
+    config: Config,
+    samples: Union[SampleBank, dict[int, str]],
+    total_secs: Optional[float] = None,
+) -> Any:
+    """
+    Mixes the voices down to a mono float array by playing each note's sample (as a
+    one-shot: the whole sample plays whatever the note's length) at the note's velocity.
+    Notes without a sample are skipped.
+    """
+    bank = samples if isinstance(samples, SampleBank) else SampleBank(samples)
+    sample_rate = bank.sample_rate
+    hits = [
+        (int(start_secs * sample_rate), bank[midi_note], velocity)
+        for start_secs, _, midi_note, velocity in note_events(voices, config)
+        if midi_note in bank
+    ]
+    end = max((start + len(sample) for start, sample, _ in hits), default=0)
+    out = np.zeros(max(int((total_secs or 0) * sample_rate), end))
+    scratch = np.empty(MIX_BLOCK_FRAMES)
+
+    for start, sample, velocity in hits:
+        mix_sample(out, start, sample, velocity / 127, scratch)
+
+    peak = np.max(np.abs(out), initial=0.0)
+    if peak > 1.0:
+        out /= peak
+    return out
+
+
+def render_samples_wav(
+    voices: list[Voice],
+    config: Config,
+    file_name: str,
+    samples: Union[SampleBank, dict[int, str]],
+    total_secs: Optional[float] = None,
+) -> Any:
+    bank = samples if isinstance(samples, SampleBank) else SampleBank(samples)
+    out = render_samples(voices, config, bank, total_secs)
+    write_wav(out, file_name, bank.sample_rate)
+    return out
@@ -0,0 +1,101 @@
+from fractions import Fraction
+
+import pytest
+
+import arrangement
+from arrangement import Arrangement
+from cyclemidi import notes
+
+VERSE = "[C4 E4] [G4 -]"
+CHORUS = "[F4,A4 ~] [G4,B4 C5,D5]"
+
+
+def times(voice):
+    return [(note.start, note.end, note.pitch) for note in voice]
+
+
+def song():
+    return (
+        Arrangement()
+        .section("verse", notes(VERSE))
+        .section("chorus", notes(CHORUS))
+        .set_config("midi_file_name", "tester.mid")
+    )
+
+
+def test_matches_one_long_cycle_list():
+    a = song().then("verse", "chorus", "verse", "verse", "chorus")
+    whole = (
+        notes(" ".join([VERSE, CHORUS, VERSE, VERSE, CHORUS]))
+        .set_config("midi_file_name", "tester.mid")
+        .midi()
+    )
+    assert a.cycle_count() == 10
+    assert a.voices() == whole.voices
+    a.midi()
+    assert a.total_secs == whole.total_secs
+    assert [track[1:] for track in a.midi_file.tracks] == [
+        track[1:] for track in whole.midi_file.tracks
+    ]
+
+
+def test_sections_compiled_once(monkeypatch):
+    compiled = []
+    parse_cycle_lists = arrangement.parse_cycle_lists
+
+    def counting_parse(cycle_lists, workers=1):
+        compiled.append(cycle_lists)
+        return parse_cycle_lists(cycle_lists, workers)
+
+    monkeypatch.setattr(arrangement, "parse_cycle_lists", counting_parse)
+    a = song().then(*["verse", "chorus"] * 50).midi()
+    assert len(compiled) == 2
+    assert a.cycle_count() == 200
+    # every placement of a section refers to the same voices
+    assert len(a.compiled) == 2
+    assert len(a.placements) == 100
+    assert len(a.voices()[0]) == 50 * 3 + 50 * 4
+
+
+def test_place_at_offset():
+    a = song().place("chorus", 4).then("verse").place("verse", 0)
+    assert [(p.section, p.start) for p in a.placements] == [
+        ("verse", 0),
+        ("chorus", 4),
+        ("verse", 6),
+    ]
+    voice = a.voices()[1]
+    assert times(voice) == [
+        (4, Fraction(9, 2), "A4"),
+        (5, Fraction(11, 2), "B4"),
+        (Fraction(11, 2), 6, "D5"),
+    ]
+    with pytest.raises(AssertionError, match="overlaps chorus"):
+        a.place("verse", 3)
+
+
+def test_sections_keep_their_own_config():
+    verse = notes(VERSE).set_config("note_width", 0.25)
+    a = (
+        Arrangement()
+        .section("verse", verse)
+        .section("chorus", notes(CHORUS))
+        .set_config("midi_file_name", "tester.mid")
+        .then("verse")
+        .midi()
+    )
+    alone = verse.set_config("midi_file_name", "tester.mid").midi()
+    assert [track[1:] for track in a.midi_file.tracks] == [
+        track[1:] for track in alone.midi_file.tracks
+    ]
+
+    # a section's own cost limits apply to it
+    strict = song().section("verse", notes("<C4 E4>").set_config("max_cycles", 1))
+    with pytest.raises(Exception, match="more than max_cycles"):
+        strict.then("verse").midi()
+
+
+def test_sections_share_tempo():
+    a = song().section("verse", notes(VERSE).set_config("beats_per_minute", 90))
+    with pytest.raises(Exception, match="Section verse is at 90 bpm"):
+        a.then("verse", "chorus").midi()
@@ -1,9 +1,14 @@
 from dataclasses import dataclass
+import os
+import random
+import subprocess
+import sys
 import pytest
 
 from mido import Message
 
-from asciimidi import ascii_to_midi
+from asciimidi import ascii_to_midi, compile_ascii, render_many, ascii_file_to_midi, AsciiStream
+from legacy_asciimidi import legacy_ascii_to_midi
 from midi import Config, midi_note_numbers, add_clock_messages
 
 SYMBOLS_PER_BEAT = 2
@@ -227,3 +232,87 @@ def test_raw_notes(config, note_factory):
     (mid, ignore) = ascii_to_midi([notes], config)
     assert expected == [mesg for mesg in mid.tracks[0] if not mesg.is_meta]
 
+
+@pytest.mark.parametrize("processes", [False, True])
+def test_render_many(config, processes):
+    scores = [
+        ["A3 -- -- D3\nC2 == E2 F2", "B3 B3 -- ==\nG2 -- A2 B2"],
+        "10 === --- 100",
+        ["C4 D4 E4 F4\nC3 == == ==\nC2 -- -- --"],
+    ]
+    expected = [compile_ascii(score, config) for score in scores]
+
+    actual = render_many(scores, config, max_workers=2, processes=processes)
+    assert [(mid.tracks, secs) for (mid, secs) in actual] == [
+        (mid.tracks, secs) for (mid, secs) in expected
+    ]
+
+def test_render_many_from_unguarded_script(tmp_path):
+    # spawned workers re-import the script that started them, so a script without an
+    # `if __name__ == "__main__":` guard would break the pool if they were spawned
+    script = tmp_path / 'song.py'
+    script.write_text(
+        'import multiprocessing\n'
+        'multiprocessing.set_start_method("spawn")\n'
+        'from asciimidi import render_many\n'
+        'from midi import Config\n'
+        'print(len(render_many(["C4 D4", "E4 F4", "G4 A4"], Config(), max_workers=2)))\n'
+    )
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, str(script)], capture_output=True, text=True, env=env)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == '3\n'
+
+@pytest.mark.parametrize("swing", [0.5, 0.55, 0.66, 0.75])
+@pytest.mark.parametrize("note_width", [0.3, 0.5, 1])
+@pytest.mark.parametrize("symbols_per_beat", [1, 2, 3, 4])
+def test_matches_legacy_emitter(config, swing, note_width, symbols_per_beat):
+    config.swing = swing
+    config.note_width = note_width
+    config.symbols_per_beat = symbols_per_beat
+    config.beats_per_measure = 3
+
+    rng = random.Random(f"{swing} {note_width} {symbols_per_beat}")
+    symbols = ["A3", "C4", "10", "E2++", "G3-", "--", "---", "==", "==="]
+    for _ in range(20):
+        # voices start with a note because a leading tie can only be expressed by
+        # shifting the legacy emitter's tempo message
+        asciis = [
+            "\n".join(
+                " ".join(["C3"] + [rng.choice(symbols) for _ in range(rng.randint(0, 15))])
+                for _ in range(3)
+            )
+            for _ in range(rng.randint(1, 2))
+        ]
+        (mid, ignore) = ascii_to_midi(asciis, config)
+        assert mid.tracks == legacy_ascii_to_midi(asciis, config).tracks
+
+def test_ascii_file_to_midi(config, tmp_path):
+    systems = [
+        "A3 == -- D3 E3\nC2 -- == F2 G2\n-- -- -- -- --",
+        "-- == B3 --\nA2 B2 C3 D3\n-- -- -- --",
+        "C4 D4 == ==\nE2 -- -- F2\n-- -- -- --",
+    ]
+    score_file = tmp_path / "score.txt"
+    score_file.write_text("\n\n".join(systems) + "\n\n\n")
+
+    (mid, secs) = ascii_file_to_midi(score_file, config)
+    (expected_mid, expected_secs) = ascii_to_midi(systems, config)
+    assert mid.tracks == expected_mid.tracks
+    assert secs == expected_secs
+
+def test_ascii_stream_is_incremental(config):
+    lines_read = []
+
+    def lines():
+        for i in range(1000):
+            lines_read.append(i)
+            yield "A3 B3 C3 D3"
+            yield ""
+
+    stream = iter(AsciiStream(lines(), config))
+    for i in range(8):
+        next(stream)
+    # the eight notes of the first two systems are all final as soon as the third
+    # system starts
+    assert len(lines_read) <= 3
@@ -0,0 +1,86 @@
+import pytest
+
+from mido import Message, MetaMessage
+
+from bandwidth import (
+    analyze_bandwidth,
+    stagger_messages,
+    queue_delays,
+    DIN_BYTES_PER_SECOND,
+)
+from cyclemidi import notes
+
+# one three byte message takes a millisecond at 3000 bytes/sec
+BUDGET = 3000
+
+
+def chord(time, pitches, mesg="note_on"):
+    return [Message(mesg, note=p, velocity=64, time=time) for p in pitches]
+
+
+def test_queue_delays():
+    messages = chord(0.0, [60, 64, 67]) + [Message("clock", time=0.0)]
+    delays = queue_delays(messages, BUDGET)
+    assert delays == pytest.approx([0.0, 0.001, 0.002, 0.003])
+
+
+def test_analyze_bandwidth():
+    messages = (
+        [MetaMessage("set_tempo", tempo=500000, time=0.0)]
+        + chord(0.0, [60, 64, 67])
+        + chord(1.0, [60, 64, 67], "note_off")
+        + chord(2.5, [62])
+        + chord(2.75, [62], "note_off")
+    )
+    report = analyze_bandwidth(messages, ["FH-2", "IAC"], 2.0, BUDGET)
+
+    assert report.peak_events_per_window == 3
+    assert report.peak_window_start == 0.0
+    assert report.peak_bytes_per_second == 9000
+    assert report.port_bytes_per_second == {"FH-2": 24 / 2.75, "IAC": 24 / 2.75}
+    assert report.peak_polyphony == 3
+    assert report.max_delay == pytest.approx(0.002)
+    # the lone note in cycle 1 never waits so only cycle 0 is reported
+    assert [load.cycle for load in report.worst_cycles] == [0]
+    assert report.worst_cycles[0].byte_count == 18
+
+
+def test_stagger_messages():
+    messages = chord(0.0, [60, 64, 67]) + chord(0.5, [60, 64, 67], "note_off")
+    staggered = stagger_messages(messages, BUDGET)
+    assert [m.time for m in staggered] == pytest.approx(
+        [0.0, 0.001, 0.002, 0.5, 0.501, 0.502]
+    )
+    # originals are left alone
+    assert [m.time for m in messages] == [0.0, 0.0, 0.0, 0.5, 0.5, 0.5]
+    assert queue_delays(staggered, BUDGET) == pytest.approx([0.0] * 6)
+
+
+def test_stagger_messages_thins_notes():
+    messages = (
+        chord(0.0, [60, 64, 67, 71])
+        + [Message("clock", time=0.0)]
+        + chord(0.5, [60, 64, 67, 71], "note_off")
+    )
+    staggered = stagger_messages(messages, BUDGET, max_delay=0.0015)
+    assert [(m.type, getattr(m, "note", None)) for m in staggered] == [
+        ("note_on", 60),
+        ("note_on", 64),
+        ("clock", None),
+        ("note_off", 60),
+        ("note_off", 64),
+    ]
+
+
+def test_cycles_bandwidth_report():
+    report = (
+        notes("[ C4,E4,G4,B4,D5 ]")
+        .set_config("midi_file_name", "tester.mid")
+        .midi()
+        .bandwidth_report()
+    )
+    assert report.bytes_per_second_budget == DIN_BYTES_PER_SECOND
+    assert report.peak_polyphony == 5
+    # start + clock + five note_ons all land at time zero
+    assert report.peak_events_per_window == 7
+    assert report.worst_cycles[0].cycle == 0
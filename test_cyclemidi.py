@@ -1,9 +1,33 @@
+import os
+import subprocess
+import sys
+from fractions import Fraction
+
 import pytest
 
 from mido import Message, MidiFile, MidiTrack, MetaMessage
 
 from midi import midi_note_numbers
-from cyclemidi import notes, rhythm
+from cyclemidi import (
+    notes,
+    rhythm,
+    Cycles,
+    CycleListType,
+    Repeat,
+    analyze_alternatives,
+    build_cycle_tree,
+    chunk_jobs,
+    estimate_cost,
+    expand_alternatives,
+    generate_chunk,
+    normalize_voice_length,
+    parse_cache,
+    parse_cycles,
+    sharing_stats,
+    split_cycles,
+    stitch_chunks,
+    tokenize,
+)
 
 VELOCITY = 5
 CHANNEL = 0
@@ -585,3 +609,324 @@ def test_two_ties_across_cycles(mid_factory):
     )
     actual = notes("[ A4 E5 ] [ - - D5 G4 ]").midi().midi_file
     assert expected.tracks == actual.tracks
+
+
+def test_gate_length(mid_factory):
+    expected = mid_factory(
+        [
+            [
+                on("A3", 0),
+                off("A3", 960),
+                on("B3", 0),
+                off("B3", 240),
+            ],
+        ]
+    )
+    actual = notes("[A3 B3]").gate_length("[1 0.25]").midi().midi_file
+    assert expected.tracks == actual.tracks
+
+
+def test_nudge(mid_factory):
+    expected = mid_factory(
+        [
+            [
+                on("A3", 0),
+                off("A3", 480),
+                on("B3", 960),
+                off("B3", 480),
+            ],
+        ]
+    )
+    actual = notes("[A3 B3]").nudge("[0 0.5]").midi().midi_file
+    assert expected.tracks == actual.tracks
+
+
+def test_all_lanes_merged(mid_factory):
+    expected = mid_factory(
+        [
+            [
+                on("A3", 0, velocity=9),
+                off("A3", 480, velocity=9),
+                on("A3", 0, velocity=9),
+                off("A3", 480, velocity=9),
+                # nudged to the middle of its slot and cut off at the end of it
+                on("C3", 720, velocity=5),
+                off("C3", 240, velocity=5),
+            ],
+        ]
+    )
+    actual = (
+        rhythm("[x x ~ x]")
+        .notes("[A3 B3 C3]")
+        .velocity("[9 5]")
+        .gate_length("[1]")
+        .nudge("[0 0.5]")
+        .midi()
+        .midi_file
+    )
+    assert expected.tracks == actual.tracks
+
+
+def sixteen_stacks():
+    cycles = Cycles()
+    for i in range(16):
+        if i:
+            cycles.stack()
+        octave = 2 + i % 4
+        cycles.rhythm("[x [x x] ~ x] [x ~ [x x x] x]").notes(
+            f"[C{octave} < D{octave} B{octave - 1} >] [A{octave} - G{octave}]"
+        ).velocity(f"[{i % 9} 9] [5 [6 7]]").gate_length("[0.5 1]")
+    return cycles
+
+
+def test_parallel_compile():
+    serial = sixteen_stacks().set_config("midi_file_name", "tester.mid").midi()
+    # otherwise the parallel compile would just be cache hits
+    parse_cache.clear()
+    parallel = (
+        sixteen_stacks()
+        .set_config("midi_file_name", "tester.mid")
+        .set_config("compile_workers", 4)
+        .midi()
+    )
+    assert len(parallel.voices) == 16
+    assert parallel.voices == serial.voices
+    assert parallel.midi_file.tracks == serial.midi_file.tracks
+
+
+def test_parallel_compile_fills_the_parse_cache():
+    parse_cache.clear()
+    cycles = (
+        sixteen_stacks()
+        .set_config("midi_file_name", "tester.mid")
+        .set_config("compile_workers", 4)
+    )
+    cycles.midi()
+    # the lanes were parsed in worker processes but are cached here, once each
+    distinct_lanes = len({lane for lane in cycles.cycle_lists if lane[1]})
+    assert parse_cache.misses == len(parse_cache.lanes) == distinct_lanes
+    cycles.midi()
+    assert parse_cache.misses == distinct_lanes
+    assert parse_cache.hits == distinct_lanes
+
+
+@pytest.mark.parametrize(
+    "song",
+    [
+        # lanes, one per worker
+        'notes("C4 D4").stack().notes("E4 F4")',
+        # a single lane split into chunks of cycles
+        'notes("[C4,E4 D4,F4] [G4,B4 A4,C5]")',
+    ],
+)
+def test_parallel_compile_from_unguarded_script(tmp_path, song):
+    # spawned workers re-import the script that started them, so a script without an
+    # `if __name__ == "__main__":` guard would break the pool if they were spawned
+    script = tmp_path / "song.py"
+    script.write_text(
+        "import multiprocessing\n"
+        'multiprocessing.set_start_method("spawn")\n'
+        "from cyclemidi import notes\n"
+        f"cycles = {song}\n"
+        'cycles.set_config("midi_file_name", "song.mid")\n'
+        'print(len(cycles.set_config("compile_workers", 2).midi().voices))\n'
+    )
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, str(script)],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=tmp_path,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == "2\n"
+
+
+# every cycle starts with a tie, in one or both voices, some of them reaching back over
+# a whole cycle of ties or rests
+TIED_CYCLES = (
+    "[C4,E4 D4] [- F4,-] [-,- ~] [- [G4 -]] [[A4,B4 -,-] -] [- -,-] [C5,- -] [~ -]"
+)
+
+
+@pytest.mark.parametrize("chunk_count", range(1, 9))
+def test_chunked_ties_at_every_edge(chunk_count):
+    (serial, cycle_count) = parse_cycles(TIED_CYCLES, CycleListType.NOTES)
+    tree = build_cycle_tree(split_cycles(TIED_CYCLES))
+    jobs = chunk_jobs(tree, CycleListType.NOTES, chunk_count, 2)
+    assert len(jobs) == chunk_count
+    assert stitch_chunks([generate_chunk(job) for job in jobs]) == serial
+
+
+def test_chunked_compile():
+    cycle_list = TIED_CYCLES * 16
+    (serial, cycle_count) = parse_cycles(cycle_list, CycleListType.NOTES)
+    (chunked, chunked_cycle_count) = parse_cycles(
+        cycle_list, CycleListType.NOTES, workers=3
+    )
+    assert chunked_cycle_count == cycle_count == 128
+    assert chunked == serial
+
+
+@pytest.mark.parametrize(
+    "repeated,written_out",
+    [
+        ("[C4*4 D4]", "[[C4 C4 C4 C4] D4]"),
+        ("[C4!3 D4]", "[C4 C4 C4 D4]"),
+        ("[C4 ~ C4 ~]@16 [D4 -]", "[C4 ~ C4 ~] " * 16 + "[D4 -]"),
+        ("[C4 [D4 E4]*2]!2", "[C4 [[D4 E4] [D4 E4]]] [C4 [[D4 E4] [D4 E4]]]"),
+        ("[C4,E4*2 -!2]", "[[C4,E4 C4,E4] - -]"),
+        ("[C4*2!2]", "[[C4 C4] [C4 C4]]"),
+        ("[C4 <D4 E4>*2]", "[C4 [D4 D4]] [C4 [E4 E4]]"),
+        ("[ [ C4 ] [ D4 ] ]@2", "[[C4] [D4]] [[C4] [D4]]"),
+        ("[ [C4 E4] [G4 E4] ] [ C5 ]@2", "[[C4 E4] [G4 E4]] [C5] [C5]"),
+    ],
+)
+def test_repeats(repeated, written_out):
+    assert parse_cycles(repeated, CycleListType.NOTES) == parse_cycles(
+        written_out, CycleListType.NOTES
+    )
+
+
+def test_repeats_parse_once():
+    tokens = tokenize("[C4 ~ C4 ~]@4096")
+    assert len(tokens) == 7
+    tree = build_cycle_tree(split_cycles("[C4 ~ C4 ~]@4096"))
+    assert tree.children == [Repeat(tree.children[0].child, 4096)]
+    (voices, cycle_count) = parse_cycles("[C4 ~ C4 ~]@4096", CycleListType.NOTES)
+    assert cycle_count == 4096
+    assert len(voices[0]) == 4 * 4096
+
+
+def test_identical_subtrees_shared():
+    tree = build_cycle_tree(split_cycles("[C4 [D4 E4]] [F4 [D4 E4]] [C4 [D4 E4]]"))
+    (first, second, third) = tree.children
+    assert first is third
+    assert first.children[1] is second.children[1]
+    stats = sharing_stats(tree)
+    assert (stats.subtrees, stats.distinct_subtrees) == (6, 3)
+    assert stats.sharing_ratio == 2
+
+
+@pytest.mark.parametrize(
+    "shared,unshared",
+    [
+        # the shared bar starts with a tie so it extends a different note each time
+        ("[C4 D4] [- E4] [F4 G4] [- E4]", "[C4 D4] [- E4] [F4 G4] [[- -] E4]"),
+        ("[C4 [D4 -]] [[D4 -] C4]", "[C4 [D4 -]] [[D4 - -] C4]"),
+        ("[C4,E4 [-,G4 A4]!2]", "[C4,E4 [-,G4 A4] [-,G4 -,- A4 -]]"),
+    ],
+)
+def test_shared_subtrees_match(shared, unshared):
+    # unshared is the same music written so that nothing in it is shared
+    assert sharing_stats(build_cycle_tree(split_cycles(shared))).sharing_ratio > 1
+    assert sharing_stats(build_cycle_tree(split_cycles(unshared))).sharing_ratio == 1
+    assert parse_cycles(shared, CycleListType.NOTES) == parse_cycles(
+        unshared, CycleListType.NOTES
+    )
+
+
+def test_cycles_sharing_stats():
+    bar = "[C4 ~ [E4 G4] ~] "
+    stats = notes(bar * 64).velocity("[5 9]").sharing_stats()
+    assert stats.subtrees == 64 * 2 + 1
+    assert stats.distinct_subtrees == 3
+
+
+@pytest.mark.parametrize(
+    "cycle_list",
+    [
+        "[" * 10000 + "C4" + "]" * 10000,
+        "[C4 " * 10000 + "D4" + "]" * 10000,
+        "[C4 [D4 - ]" * 5000 + "]" * 5000,
+    ],
+    ids=["only child", "last child", "ties"],
+)
+def test_deeply_nested(cycle_list):
+    assert sys.getrecursionlimit() < 10000
+    (voices, cycle_count) = parse_cycles(cycle_list, CycleListType.NOTES)
+    assert cycle_count == 1
+    assert voices[0][0].start == 0
+    assert voices[0][-1].end == 1
+    assert sharing_stats(build_cycle_tree(split_cycles(cycle_list))).subtrees == 10000
+
+
+def test_deeply_nested_shared():
+    bar = "[" * 10000 + "C4 D4" + "]" * 10000 + " "
+    (voices, cycle_count) = parse_cycles(bar * 2, CycleListType.NOTES)
+    assert cycle_count == 2
+    assert [(note.start, note.pitch) for note in voices[0]] == [
+        (0, "C4"),
+        (Fraction(1, 2), "D4"),
+        (1, "C4"),
+        (Fraction(3, 2), "D4"),
+    ]
+
+
+def test_normalize_voice_length_reuses_notes():
+    (long_voices, _) = parse_cycles("C4 D4 E4 F4", CycleListType.NOTES)
+    (short_voices, _) = parse_cycles("G4 A4", CycleListType.NOTES)
+    (long_voice, short_voice) = normalize_voice_length(long_voices + short_voices, 4)
+    assert all(a is b for a, b in zip(long_voice, long_voices[0]))
+    assert all(a is b for a, b in zip(short_voice, short_voices[0]))
+    assert [note.start for note in short_voice] == [0, 1, 2, 3]
+    # the parsed (and cached) voices are untouched
+    assert [note.start for note in short_voices[0]] == [0, 1]
+
+
+def test_mutating_voices_leaves_cached_notes_alone():
+    cycle_list = "[C4 D4] [E4 - F4]"
+    first = notes(cycle_list).midi()
+    expected_tracks = first.midi_file.tracks
+    for note in first.voices[0]:
+        note.pitch = "G4"
+        note.end += 1
+    # the same cycle list again is a parse_cycles cache hit
+    second = notes(cycle_list).midi()
+    assert [note.pitch for note in second.voices[0]] == ["C4", "D4", "E4", "F4"]
+    assert second.voices[0][-1].end == 2
+    assert second.midi_file.tracks == expected_tracks
+
+
+@pytest.mark.parametrize(
+    "cycle_list",
+    ["C4 D4", "<C4 D4> E4", "[C4 <D4 E4 F4>] <G4 <A4 B4>>", "< D4 E4 > <C4,E4 ->!2"],
+)
+def test_analyze_alternatives(cycle_list):
+    expanded = expand_alternatives(cycle_list)
+    (_, length, _) = analyze_alternatives(cycle_list)
+    assert length == len(expanded)
+    lane = estimate_cost([(CycleListType.NOTES, cycle_list)]).lanes[0]
+    (voices, cycle_count) = parse_cycles(cycle_list, CycleListType.NOTES)
+    # the representative copy has the longest of every alternative
+    assert lane.cycle_count >= cycle_count
+    assert lane.note_count >= sum(len(voice) for voice in voices)
+    assert lane.voice_count == len(voices)
+
+
+def test_estimate_cost():
+    cycles = notes("C4,E4 [D4,F4 -,-]!3 [G4,B4 ~,~]@4").velocity("[5,5 9,9] 7,7")
+    cycles.stack().notes("C2")
+    estimate = cycles.estimate_cost()
+    assert [lane.cycle_count for lane in estimate.lanes] == [8, 2, 1]
+    assert estimate.cycle_count == 8
+    assert estimate.voice_count == 3
+    cycles.set_config("midi_file_name", "tester.mid").midi()
+    assert estimate.note_count >= sum(len(voice) for voice in cycles.voices)
+
+
+def test_cost_limits_fail_fast():
+    # 10**10 copies if it were expanded
+    alternatives = "<C4 D4 E4 F4 G4 A4 B4 C5 D5 E5> " * 10
+    with pytest.raises(Exception, match="lane 2 .*max_expanded_chars"):
+        notes("C4").stack().notes(alternatives).midi()
+
+    cycles = notes("C4 " * 7).velocity("5 " * 11).velocity("5 " * 13)
+    cycles.set_config("max_cycles", 1000)
+    with pytest.raises(Exception, match="lane 2 .* 1,001 cycles, more than max_cycles"):
+        cycles.midi()
+
+    cycles = notes("[C4 D4]@1000").set_config("max_notes", 1000)
+    with pytest.raises(Exception, match="lane 0 .* 2,000 notes"):
+        cycles.midi()
@@ -0,0 +1,180 @@
+import io
+import time
+
+import pytest
+
+from mido import Message
+
+from cyclemidi import notes
+from midi import (
+    multi_port_play,
+    VirtualClock,
+    RecordingPort,
+    PortPool,
+    SystemClock,
+    EventRing,
+    ConsoleVisualizer,
+    LOOP_EVENT,
+)
+
+# 120 bpm, 4 beats per cycle: 2 seconds per cycle, 48 clock pulses per second
+
+
+@pytest.fixture
+def song(tmp_path):
+    return (
+        notes("[A3 C4]")
+        .set_config("midi_file_name", str(tmp_path / "song.mid"))
+        .set_config("midi_devices", ["FH-2", "IAC"])
+        .midi()
+    )
+
+
+def test_play_with_virtual_clock(song):
+    clock = VirtualClock(1000.0)
+    ports = [RecordingPort(clock, name) for name in song.config.midi_devices]
+    stats = multi_port_play(ports, song.config, song.total_secs, clock, loops=2)
+
+    for port in ports:
+        sent = [(round(t - 1000.0, 6), m.type) for (t, m) in port.sent]
+        notes_sent = [(t, mesg_type) for (t, mesg_type) in sent if mesg_type != "clock"]
+        assert notes_sent == [
+            (0.0, "start"),
+            (0.0, "note_on"),
+            (0.5, "note_off"),
+            (1.0, "note_on"),
+            (1.5, "note_off"),
+            # second loop, offset by the length of the song
+            (2.0, "start"),
+            (2.0, "note_on"),
+            (2.5, "note_off"),
+            (3.0, "note_on"),
+            (3.5, "note_off"),
+            # shutdown
+            (3.5, "stop"),
+        ]
+        # clock messages run up to the last note of each loop
+        clock_times = [t for (t, mesg_type) in sent if mesg_type == "clock"]
+        assert clock_times[:3] == pytest.approx([0.0, 1 / 48, 2 / 48], abs=1e-6)
+        assert len(clock_times) == 2 * (1 + 1.5 * 48)
+        assert port.reset_count == 1
+
+    assert stats.loops == 2
+    assert stats.events == len(ports[0].sent) - 1  # everything but the final stop
+    # virtual time only moves when the loop sleeps so nothing is ever late
+    assert stats.max_lateness == 0.0
+    assert stats.overhead_per_event > 0.0
+
+
+def test_play_shuts_down_on_interrupt(song):
+    clock = VirtualClock()
+
+    class InterruptingPort(RecordingPort):
+        def send(self, message):
+            super().send(message)
+            if message.type == "note_off":
+                raise KeyboardInterrupt()
+
+    port = InterruptingPort(clock)
+    with pytest.raises(SystemExit):
+        multi_port_play([port], song.config, song.total_secs, clock)
+    assert [m.type for (t, m) in port.sent][-2:] == ["note_off", "stop"]
+    assert port.reset_count == 1
+
+
+def test_port_pool_reuses_ports(song):
+    clock = VirtualClock()
+    opened = []
+
+    def open_output(name):
+        opened.append(RecordingPort(clock, name))
+        return opened[-1]
+
+    pool = PortPool(open_output)
+    for _ in range(3):
+        ports = pool.get(song.config.midi_devices)
+        multi_port_play(ports, song.config, song.total_secs, clock, loops=1)
+        for port in ports:
+            port.close()
+
+    assert [port.name for port in opened] == ["FH-2", "IAC"]
+    assert not any(port.closed for port in opened)
+    assert [m.type for (t, m) in opened[0].sent].count("start") == 3
+    assert (pool.stats.opens, pool.stats.reuses, pool.stats.reconnects) == (2, 4, 0)
+
+    pool.close()
+    assert all(port.closed for port in opened)
+
+
+def test_port_pool_reconnects(song):
+    clock = VirtualClock()
+    opened = []
+
+    class UnpluggedPort(RecordingPort):
+        def send(self, message):
+            if message.type == "note_off":
+                raise OSError("device went away")
+            super().send(message)
+
+    def open_output(name):
+        opened.append(RecordingPort(clock, name) if opened else UnpluggedPort(clock))
+        return opened[-1]
+
+    pool = PortPool(open_output)
+    multi_port_play(pool.get(["FH-2"]), song.config, song.total_secs, clock, loops=1)
+
+    assert pool.stats.reconnects == 1
+    assert opened[0].closed
+    # the message that failed was sent again on the new port
+    assert [m.type for (t, m) in opened[1].sent if m.type != "clock"] == [
+        "note_off",
+        "note_on",
+        "note_off",
+        "stop",
+    ]
+
+
+def test_event_ring():
+    ring = EventRing(4)
+    for note in range(3):
+        ring.push((0, note))
+    assert ring.read(0) == ([(0, 0), (0, 1), (0, 2)], 3, 0)
+    for note in range(3, 9):
+        ring.push((0, note))
+    # the reader fell behind by more than the ring holds
+    assert ring.read(3) == ([(0, 5), (0, 6), (0, 7), (0, 8)], 9, 2)
+    assert ring.read(9) == ([], 9, 0)
+
+
+def test_console_visualizer():
+    out = io.StringIO()
+    visualizer = ConsoleVisualizer(30, out)
+    for event in [(0, 57), (1, 48), (0, 60), LOOP_EVENT, (1, 50)]:
+        visualizer.ring.push(event)
+    visualizer.draw()
+    visualizer.ring.push((0, 62))
+    visualizer.draw()
+    assert out.getvalue().splitlines() == [
+        "0: A3 C4",
+        "1: C3",
+        "-" * 72,
+        "1: D3",
+        "0: D4",
+    ]
+
+
+def test_slow_console_doesnt_delay_play(song):
+    class SlowTerminal(io.StringIO):
+        def write(self, s):
+            time.sleep(0.2)
+            return super().write(s)
+
+    out = SlowTerminal()
+    song.config.beats_per_minute = 480
+    port = RecordingPort(SystemClock())
+    visualizer = ConsoleVisualizer(30, out)
+    stats = multi_port_play(
+        [port], song.config, song.total_secs / 4, loops=1, visualizer=visualizer
+    )
+    assert stats.max_lateness < 0.05
+    assert "A3" in out.getvalue() and "C4" in out.getvalue()
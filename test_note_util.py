@@ -1,4 +1,13 @@
-from note_util import n, set_key
+import asyncio
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+
+import pytest
+
+from asciimidi import ascii_to_midi
+from midi import Config
+from note_util import n, set_key, get_key, key, Score, concat, make_lines, add_scale_steps_batch, add_semitones_batch
 
 def test_str_of_note():
     # str of note
@@ -71,3 +80,106 @@ def test_subtract_fixed_intervals():
     assert n("F#3") == n("G3")-"m2"
     # subtract fixed interval from note (leave key)
     assert n("F3") == n("G3")-"M2"
+
+def test_notes_are_interned():
+    set_key("G major")
+    assert n("G3") is n("G3", "G major")
+    assert n("B3") is n("G3")+2
+    assert n("G3") is not n("G3", "E minor")
+    assert n("G3", "E minor") != n("G3", "G major")
+    assert pickle.loads(pickle.dumps(n("G3"))) is n("G3")
+
+def test_notes_are_immutable():
+    note = n("G3", "G major")
+    with pytest.raises(AttributeError):
+        note.octave = 4
+    with pytest.raises(AttributeError):
+        note.foo = "bar"
+
+def test_precomputed_fields():
+    set_key("G major")
+    assert n("C4").midi == 60
+    assert n("F#3").midi == 54
+    assert n("Bb2").midi == 46
+    # C is the first pitch of every key's table so degrees count from C0
+    assert n("C0").degree == 0
+    assert n("F#3").degree == 24
+    assert n("Bb2").degree is None
+
+def test_scale_steps_from_note_not_in_key():
+    with pytest.raises(ValueError):
+        n("Bb2", "G major")+1
+
+def test_add_scale_steps_batch():
+    set_key("G major")
+    notes = [n("G3"), n("B3"), n("D4"), n("E3")]
+    assert add_scale_steps_batch(notes, 2) == [note+2 for note in notes]
+    assert add_scale_steps_batch(notes, [1, -2, 6, -6]) == [n("A3"), n("G3"), n("C5"), n("F#2")]
+    in_e_minor = [n("F#3", "E minor"), n("A3"), n("C4"), n("D3")]
+    assert add_scale_steps_batch(notes, -1, "E minor") == in_e_minor
+    set_key("G major")
+    # far outside the precomputed tables
+    assert add_scale_steps_batch([n("G3")], 70) == [n("G13")]
+    with pytest.raises(ValueError):
+        add_scale_steps_batch([n("G3"), n("Bb3")], 1, "G major")
+
+def test_add_semitones_batch():
+    set_key("G major")
+    notes = [n("G3"), n("Bb3"), n("B9")]
+    assert add_semitones_batch(notes, 7) == [note+"P5" for note in notes]
+    assert add_semitones_batch(notes, [-1, 1, 48]) == [n("F#3"), n("B3"), n("B13")]
+
+def test_key_scope():
+    set_key("G major")
+    with key("E minor"):
+        assert get_key() == "E minor"
+        assert n("F#3") == n("G3")-1
+        with key("F major"):
+            assert n("Bb3") == n("A3")+1
+        assert get_key() == "E minor"
+    assert get_key() == "G major"
+
+def test_key_per_thread():
+    barrier = Barrier(2)
+
+    def climb(k, root):
+        with key(k):
+            # make sure both threads have set their key before either one uses it
+            barrier.wait()
+            return [str(n(root)+i) for i in range(8)]
+
+    with ThreadPoolExecutor(2) as pool:
+        major = pool.submit(climb, "C major", "C4")
+        minor = pool.submit(climb, "A minor", "A3")
+        assert major.result() == ["C4", "D4", "E4", "F4", "G4", "A4", "B4", "C5"]
+        assert minor.result() == ["A3", "B3", "C4", "D4", "E4", "F4", "G4", "A4"]
+
+def test_key_per_task():
+    async def climb(k, root):
+        set_key(k)
+        await asyncio.sleep(0)
+        return [str(n(root)+i) for i in range(3)]
+
+    async def main():
+        return await asyncio.gather(climb("D major", "D4"), climb("Bb major", "Bb3"))
+
+    set_key("G major")
+    assert asyncio.run(main()) == [["D4", "E4", "F#4"], ["Bb3", "C4", "D4"]]
+    assert get_key() == "G major"
+
+def test_score():
+    bars = [f"{n(p, 'C major')} == -- C4\nC3 -- == ==" for p in ("C4", "D4", "E4", "F4", "G4")]
+    score = Score(bars[:2]).add(bars[2]).add(bars[3], bars[4])
+    assert len(score) == 5
+    assert score.lines() == make_lines(bars)
+    assert score.text() == concat(bars)
+    assert str(Score(bars, bars_per_line=4)) == concat(bars)
+    assert Score(bars, bars_per_line=4).lines() == [concat(bars[:4]), concat(bars[4:])]
+
+def test_score_midi():
+    config = Config(midi_file_name="tester.mid")
+    bars = ["A3 == -- C4\nC3 -- == ==", "B3 B3 -- D4\nE3 F3 == G3"] * 3
+    (mid, secs) = Score(bars).midi(config)
+    (expected_mid, expected_secs) = ascii_to_midi(make_lines(bars), config)
+    assert mid.tracks == expected_mid.tracks
+    assert secs == expected_secs
@@ -0,0 +1,82 @@
+from fractions import Fraction
+
+from cyclemidi import CycleListType, Note, parse_cycles
+from pattern import pattern
+
+# ties within cycles, across a cycle boundary and over a whole cycle
+CYCLES = "[C4,E4 [D4 - F4,G4]] [- A4,- ~] [- -,- B4 -]"
+
+
+def times(voice):
+    return [(note.start, note.end, note.pitch) for note in voice]
+
+
+def test_matches_parse_cycles():
+    (expected, cycle_count) = parse_cycles(CYCLES * 4, CycleListType.NOTES)
+    assert pattern(CYCLES).query(0, 12) == expected
+
+
+def test_query_pieces():
+    (expected, cycle_count) = parse_cycles(CYCLES * 4, CycleListType.NOTES)
+    p = pattern(CYCLES)
+    voices = [[], []]
+    for i in range(24):
+        for voice, notes in zip(voices, p.query(Fraction(i, 2), Fraction(i + 1, 2))):
+            voice.extend(notes)
+    assert voices == expected
+
+
+def test_lazy_and_memoized():
+    p = pattern("[C4 D4] [- E4] [F4] [G4] [A4] [B4] [C5] [D5]")
+    voices = p.query(3000, 3001)
+    # only the cycle queried and the one after it (for its leading ties) were generated
+    assert sorted(p.cycles) == [0, 1]
+    assert times(voices[0]) == [
+        (3000, Fraction(6001, 2), "C4"),
+        (Fraction(6001, 2), Fraction(6003, 2), "D4"),
+    ]
+    assert p.query(3000, 3001) is voices
+
+
+def test_fast_and_slow():
+    p = pattern("[C4 D4] [E4]")
+    assert times(p.fast(2).query(0, 1)[0]) == [
+        (0, Fraction(1, 4), "C4"),
+        (Fraction(1, 4), Fraction(1, 2), "D4"),
+        (Fraction(1, 2), 1, "E4"),
+    ]
+    assert times(p.slow(2).query(0, 2)[0]) == [
+        (0, 1, "C4"),
+        (1, 2, "D4"),
+    ]
+
+
+def test_shift():
+    p = pattern("[C4 D4] [E4]").shift(Fraction(1, 2))
+    assert times(p.query(0, 1)[0]) == [
+        (Fraction(1, 2), 1, "C4"),
+    ]
+
+
+def test_rev():
+    p = pattern(CYCLES).rev()
+    assert times(p.query(0, 1)[0]) == [
+        (0, Fraction(1, 6), "F4"),
+        (Fraction(1, 6), Fraction(1, 2), "D4"),
+        # tied over into the next cycle in the original, cut off at the cycle's end
+        (Fraction(1, 2), 1, "C4"),
+    ]
+    assert p.query(0, Fraction(1, 2))[0] == p.query(0, 1)[0][:2]
+
+
+def test_every():
+    p = pattern("[C4 D4] [E4 F4]").every(2, lambda p: p.fast(2))
+    # cycles 0 and 1 squeezed into cycle 0 then cycle 1 as is
+    two_cycles = ["C4", "D4", "E4", "F4"] + ["E4", "F4"]
+    assert [note.pitch for note in p.query(0, 4)[0]] == two_cycles * 2
+
+
+def test_other_lane_types():
+    p = pattern("[1 5 9]", CycleListType.VELOCITY)
+    assert [note.velocity for note in p.query(5, 6)[0]] == [14, 70, 127]
+    assert p.query(5, 6)[0][0] == Note(5, Fraction(16, 3), velocity=14)
@@ -0,0 +1,137 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from cyclemidi import notes
+from midi import RecordingPort, VirtualClock
+from playlist import Playlist, compile_entry
+
+# 1 second per cycle
+BPM = 240
+
+
+def song(cycle_list):
+    return notes(cycle_list).set_config("beats_per_minute", BPM)
+
+
+def note_ons(port):
+    return [
+        (round(t, 6), message.note)
+        for t, message in port.sent
+        if message.type == "note_on"
+    ]
+
+
+def test_gapless():
+    clock = VirtualClock()
+    port = RecordingPort(clock)
+    stats = (
+        Playlist(processes=False)
+        .set_config("visualizer_fps", None)
+        .add(song("C4 D4"), loops=2)
+        .add(song("[E4 F4] G4 A4"))
+        .play([port], clock)
+    )
+    assert note_ons(port) == [
+        (0, 60),
+        (1, 62),
+        (2, 60),
+        (3, 62),
+        (4, 64),
+        (4.5, 65),
+        (5, 67),
+        (6, 69),
+    ]
+    assert [message.type for _, message in port.sent].count("start") == 1
+    assert [message.type for _, message in port.sent].count("stop") == 1
+    assert port.reset_count == 1
+    assert stats.loops == 3
+    assert stats.late_compiles == 0
+
+
+def test_compile_in_worker_process_from_unguarded_script(tmp_path):
+    # the default worker is a process, spawned workers re-import the script that
+    # started them so a script without an `if __name__ == "__main__":` guard would
+    # break the pool if it were spawned
+    script = tmp_path / "set.py"
+    script.write_text(
+        "import multiprocessing\n"
+        'multiprocessing.set_start_method("spawn")\n'
+        "from cyclemidi import notes\n"
+        "from midi import RecordingPort, VirtualClock\n"
+        "from playlist import Playlist\n"
+        "clock = VirtualClock()\n"
+        "port = RecordingPort(clock)\n"
+        f"song = notes('C4 D4').set_config('beats_per_minute', {BPM})\n"
+        "stats = (\n"
+        "    Playlist().set_config('visualizer_fps', None)\n"
+        "    .add(song, loops=2).add(song).play([port], clock)\n"
+        ")\n"
+        "print(stats.loops, sum(m.type == 'note_on' for _, m in port.sent))\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run(
+        [sys.executable, str(script)],
+        capture_output=True,
+        text=True,
+        env=env,
+        cwd=tmp_path,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == "3 6\n"
+
+
+def test_late_compile(caplog):
+    clock = VirtualClock()
+    port = RecordingPort(clock)
+
+    def slow_compile(job):
+        compiled = compile_entry(job)
+        if len(compiled.messages) < 100:
+            # the second song finishes compiling 300 seconds into the first one
+            while not port.sent:
+                time.sleep(0.001)
+            clock.sleep(300)
+        return compiled
+
+    stats = (
+        Playlist(processes=False, compile=slow_compile)
+        .set_config("visualizer_fps", None)
+        .add(song("C4 " * 200))
+        .add(song("D4"))
+        .play([port], clock)
+    )
+    assert stats.late_compiles == 1
+    assert stats.late_starts[0][0] == 1
+    assert stats.late_starts[0][1] >= 100
+    (late_at, late_note) = note_ons(port)[-1]
+    assert late_note == 62
+    assert late_at == round(200 + stats.late_starts[0][1], 6)
+    assert [record.levelname for record in caplog.records] == ["WARNING"]
+    assert "entry 1 finished compiling" in caplog.text
+
+
+def test_stop_and_compile_errors():
+    clock = VirtualClock()
+    port = RecordingPort(clock)
+    stop = threading.Event()
+    stop.set()
+    stats = (
+        Playlist()
+        .set_config("visualizer_fps", None)
+        .add(song("C4 D4"))
+        .add(song("E4"))
+        .play([port], clock, stop)
+    )
+    assert stats.events == 0
+    assert port.reset_count == 1
+
+    playlist = Playlist(processes=False).set_config("visualizer_fps", None)
+    playlist.add(song("C4")).add(song("C4 " * 11).set_config("max_cycles", 10))
+    with pytest.raises(Exception, match="max_cycles"):
+        playlist.play([port], clock)
+    assert port.reset_count == 2
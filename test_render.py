@@ -0,0 +1,145 @@
+import tracemalloc
+import wave
+
+import numpy as np
+import pytest
+
+from cyclemidi import notes
+from render import (
+    render_voices,
+    render_samples,
+    note_events,
+    SampleBank,
+    SAMPLE_RATE,
+    RELEASE_SECS,
+    VOICE_GAIN,
+    MIX_BLOCK_FRAMES,
+)
+
+# 120 bpm, 4 beats per cycle: 2 seconds per cycle
+
+
+def test_note_events():
+    cycles = notes("[A4 ~ C5 B4]").velocity("[9 9 9 0]").midi()
+    assert note_events(cycles.voices, cycles.config) == [
+        (0.0, 0.25, 69, 127),
+        (1.0, 0.25, 72, 127),
+        (1.5, 0.25, 71, 0),
+    ]
+
+
+def test_render_sine():
+    cycles = notes("[A4 ~]").set_config("note_width", 1).midi()
+    samples = render_voices(cycles.voices, cycles.config, cycles.total_secs)
+    assert len(samples) == 2 * SAMPLE_RATE
+
+    sounding = samples[:SAMPLE_RATE]
+    # roughly VOICE_GAIN * velocity 70 out of 127
+    assert np.max(np.abs(sounding)) == pytest.approx(VOICE_GAIN * 70 / 127, rel=0.01)
+    spectrum = np.abs(np.fft.rfft(sounding))
+    assert np.argmax(spectrum) == 440  # one second of samples: bins are 1Hz apart
+
+    # silent once the release is over
+    release_end = int((1 + RELEASE_SECS) * SAMPLE_RATE) + 1
+    assert not np.any(samples[release_end:])
+
+
+def test_render_width_and_nudge():
+    cycles = notes("[A4 A4]").gate_length("[0.5]").nudge("[0 0.5]").midi()
+    samples = render_voices(cycles.voices, cycles.config, cycles.total_secs)
+    # first note from 0s to 0.5s (plus release), second nudged to 1.5s
+    first_half = np.flatnonzero(samples[:SAMPLE_RATE])
+    second_half = np.flatnonzero(samples[SAMPLE_RATE:])
+    assert first_half[0] <= 1
+    assert 0.5 * SAMPLE_RATE < first_half[-1] < (0.5 + RELEASE_SECS) * SAMPLE_RATE + 1
+    assert 0.5 * SAMPLE_RATE - 1 <= second_half[0] <= 0.5 * SAMPLE_RATE + 1
+
+
+def test_render_normalizes():
+    cycles = notes("[C4,E4,G4,B4,D5,F5,A5 ]").velocity("[9,9,9,9,9,9,9]").midi()
+    samples = render_voices(
+        cycles.voices, cycles.config, cycles.total_secs, waveform="square"
+    )
+    assert np.max(np.abs(samples)) == pytest.approx(1.0)
+
+
+def test_wav(tmp_path):
+    wav_file_name = str(tmp_path / "song.wav")
+    (
+        notes("[C4 E4 G4]")
+        .set_config("midi_file_name", str(tmp_path / "song.mid"))
+        .set_config("wav_file_name", wav_file_name)
+        .midi()
+        .wav("saw")
+    )
+    with wave.open(wav_file_name) as f:
+        assert f.getnchannels() == 1
+        assert f.getsampwidth() == 2
+        assert f.getframerate() == SAMPLE_RATE
+        assert f.getnframes() == 2 * SAMPLE_RATE
+
+
+def write_sample(file_name, frames, channels=1, sample_rate=SAMPLE_RATE):
+    with wave.open(str(file_name), "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(np.asarray(frames, dtype="<i2").tobytes())
+    return str(file_name)
+
+
+@pytest.fixture
+def drums(tmp_path):
+    # long enough to need several mix blocks
+    kick = np.full(MIX_BLOCK_FRAMES * 2 + 10, 16384)
+    # stereo, left and right average out to 8192
+    snare = np.tile([12288, 4096], 100)
+    return {
+        36: write_sample(tmp_path / "kick.wav", kick),
+        38: write_sample(tmp_path / "snare.wav", snare, channels=2),
+    }
+
+
+def test_sample_bank(drums):
+    bank = SampleBank(drums)
+    assert isinstance(bank[36], np.memmap)
+    assert bank[36].shape == (MIX_BLOCK_FRAMES * 2 + 10, 1)
+    assert bank[38].shape == (100, 2)
+    assert 40 not in bank
+
+
+def test_sample_bank_sample_rate(tmp_path):
+    with pytest.raises(Exception):
+        SampleBank(
+            {36: write_sample(tmp_path / "low.wav", [0] * 10, sample_rate=22050)}
+        )
+
+
+def test_render_samples(drums):
+    # 42 has no sample so it's skipped
+    cycles = notes("[36 38 42 [36 38]]").velocity("[9 9 9 [9 0]]").midi()
+    out = render_samples(cycles.voices, cycles.config, drums, cycles.total_secs)
+    assert len(out) == 2 * SAMPLE_RATE
+
+    half = 0.5 * SAMPLE_RATE
+    kick = MIX_BLOCK_FRAMES * 2 + 10
+    assert np.all(out[:kick] == 0.5)
+    assert not np.any(out[kick : int(half)])
+    assert np.all(out[int(half) : int(half) + 100] == 0.25)
+    assert not np.any(out[int(half) + 100 : int(3 * half)])
+    assert np.all(out[int(3 * half) : int(3 * half) + kick] == 0.5)
+    # the second snare hit has velocity 0
+    assert not np.any(out[int(3 * half) + kick :])
+
+
+def test_render_samples_memory_is_flat(drums):
+    def peak_memory(hit_count):
+        cycles = notes(f"[{' '.join(['36'] * hit_count)}]").midi()
+        tracemalloc.start()
+        render_samples(cycles.voices, cycles.config, drums, cycles.total_secs)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    # copying the kick for every hit would take 1000 * 8202 * 8 bytes, ~65MB
+    assert peak_memory(1000) - peak_memory(10) < 1_000_000
@@ -0,0 +1,66 @@
+import os
+import time
+
+from cyclemidi import estimate_lane_size, parse_cache
+from midi import PortPool, RecordingPort, SystemClock
+from watch import Watcher
+
+SONG = """
+from cyclemidi import notes
+
+notes("{notes}").stack().notes("[C2 G2]").set_config(
+    "midi_file_name", {midi_file_name!r}
+).set_config("midi_devices", ["FH-2"]).midi().play()
+"""
+
+
+def write_song(path, notes, mtime):
+    path.write_text(SONG.format(notes=notes, midi_file_name=str(path) + ".mid"))
+    os.utime(path, (mtime, mtime))
+
+
+def wait_for(condition):
+    deadline = time.time() + 5
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_watch(tmp_path):
+    song_file = tmp_path / "song.py"
+    write_song(song_file, "[C4 E4]", time.time() - 10)
+    opened = []
+
+    def open_output(name):
+        opened.append(RecordingPort(SystemClock(), name))
+        return opened[-1]
+
+    watcher = Watcher(str(song_file), PortPool(open_output))
+    try:
+        assert watcher.poll()
+        assert not watcher.poll()
+        wait_for(lambda: any(m.type == "note_on" for (t, m) in opened[0].sent))
+
+        misses = parse_cache.misses
+        estimate_misses = estimate_lane_size.cache_info().misses
+        write_song(song_file, "[D4 F4]", time.time())
+        assert watcher.poll()
+        port = opened[0]
+        wait_for(
+            lambda: any(m.type == "note_on" and m.note == 62 for (t, m) in port.sent)
+        )
+        # the old version was stopped before the new one started
+        types = [m.type for (t, m) in port.sent]
+        assert types.count("stop") == 1
+        assert types.index("stop") < types.index("start", 1)
+        # only the lane that changed was re-parsed (and re-estimated)
+        assert parse_cache.misses == misses + 1
+        assert estimate_lane_size.cache_info().misses == estimate_misses + 1
+    finally:
+        watcher.close()
+
+    # the port was opened once and kept open until the watcher closed
+    assert len(opened) == 1
+    assert opened[0].closed
+    assert len(watcher.latencies) == 2
+    assert all(0 <= latency < 5 for latency in watcher.latencies)
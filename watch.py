@@ -0,0 +1,126 @@
+"""
+Live coding: `python -m cyclemidi watch song.py` (or `python watch.py song.py`) runs the
+song and then re-runs it every time the file is saved, in the same interpreter.  Unlike
+restarting Python on every save (e.g. with entr) mido and the backend stay imported,
+the MIDI ports stay open and the parse cache stays warm so only the lanes that changed
+are re-parsed.  The song keeps playing until the new version is ready to take over.
+"""
+
+import os
+import runpy
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+import midi
+from midi import Config, PortPool, multi_port_play
+
+POLL_SECS = 0.05
+
+
+class InterruptibleClock:
+    """
+    Real time, but sleeping returns early as soon as stop is set so that a new version
+    of the song doesn't have to wait for the old one to finish a long rest.
+    """
+
+    def __init__(self, stop: threading.Event) -> None:
+        self.stop = stop
+
+    def time(self) -> float:
+        return time.time()
+
+    def sleep(self, secs: float) -> None:
+        self.stop.wait(secs)
+
+
+class Watcher:
+    def __init__(
+        self,
+        song_file: str,
+        port_pool: Optional[PortPool] = None,
+    ) -> None:
+        self.song_file = song_file
+        self.port_pool = port_pool or midi.port_pool
+        self.mtime: Optional[float] = None
+        self.saved_at = 0.0
+        self.stop_playing = threading.Event()
+        self.player: Optional[threading.Thread] = None
+        # seconds from each save to the new version starting to play
+        self.latencies: list[float] = []
+
+    def stop(self) -> None:
+        if self.player is not None:
+            self.stop_playing.set()
+            self.player.join()
+            self.player = None
+
+    def play(self, config: Config, total_secs: int) -> None:
+        """
+        Stands in for play_midi while the song runs: swaps the new version in for the
+        old one and returns straight away.
+        """
+        ports = self.port_pool.get(config.midi_devices)
+        self.stop()
+        self.stop_playing = threading.Event()
+        clock = InterruptibleClock(self.stop_playing)
+        self.player = threading.Thread(
+            target=multi_port_play,
+            args=(ports, config, total_secs, clock),
+            kwargs={"stop": self.stop_playing},
+            daemon=True,
+        )
+        self.player.start()
+        latency = time.time() - self.saved_at
+        self.latencies.append(latency)
+        print(f"{self.song_file}: playing {latency * 1000:.0f}ms after save")
+
+    def run_song(self) -> None:
+        previous_handler = midi.play_handler
+        midi.play_handler = self.play
+        try:
+            runpy.run_path(self.song_file, run_name="__main__")
+        except Exception:
+            # keep playing the last version that worked
+            traceback.print_exc()
+        finally:
+            midi.play_handler = previous_handler
+
+    def poll(self) -> bool:
+        """
+        Re-runs the song if it's been saved since the last poll, returns whether it did.
+        """
+        mtime = os.stat(self.song_file).st_mtime
+        if mtime == self.mtime:
+            return False
+        # the first run isn't a save, it starts as soon as we notice the file
+        self.saved_at = mtime if self.mtime is not None else time.time()
+        self.mtime = mtime
+        self.run_song()
+        return True
+
+    def close(self) -> None:
+        self.stop()
+        self.port_pool.close()
+
+    def watch(self, poll_secs: float = POLL_SECS) -> None:
+        try:
+            while True:
+                self.poll()
+                time.sleep(poll_secs)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+
+def main(args: list[str]) -> None:
+    if len(args) != 2 or args[0] != "watch":
+        sys.exit("usage: python -m cyclemidi watch song.py")
+    Watcher(args[1]).watch()
+
+
+if __name__ == "__main__":
+    main(["watch"] + sys.argv[1:])